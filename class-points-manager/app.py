@@ -1,10 +1,20 @@
-from flask import Flask, render_template, jsonify, request, send_file, make_response, session, redirect, url_for, send_from_directory
+import time
+STARTUP_T0 = time.perf_counter()  # 冷启动计时起点 (见 1.2 节)
+from flask import Flask, render_template, jsonify, request, send_file, make_response, session, redirect, url_for, send_from_directory, g, Response
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-import sqlite3, json, os, io, sys, re, time, threading, datetime, socket, webbrowser
+import sqlite3, json, os, io, sys, re, argparse, threading, datetime, socket, webbrowser, queue, itertools, tempfile, base64, functools, uuid, gzip, pathlib, signal, importlib.util, collections, hashlib, mimetypes
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from datetime import datetime
-from openpyxl import Workbook, load_workbook
-from pyngrok import ngrok, conf
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # --- 1. 配置与路径 ---
 class Config:
@@ -17,20 +27,262 @@ class Config:
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
     DATABASE_PATH = os.path.join(DATA_DIR, 'class_points.db')
     NGROK_BIN_DIR = os.path.join(DATA_DIR, 'ngrok_bin')
+    ARCHIVE_DIR = os.path.join(DATA_DIR, 'archive')  # 学期归档库 <学期>.db
+    BACKUP_DIR = os.path.join(DATA_DIR, 'backups')
+    # 在线备份：每步拷贝的页数、步间休眠 (秒)、保留份数、自动备份间隔 (小时，0 为关闭)
+    BACKUP_PAGES = 256
+    BACKUP_STEP_SLEEP = 0.05
+    BACKUP_KEEP = 7
+    BACKUP_INTERVAL_HOURS = 24
+    # 余额对账：自动对账间隔 (小时，0 为关闭)，只报告不修复
+    RECONCILE_INTERVAL_HOURS = 24
+    # 实时推送 (SSE)：每个订阅常驻占用一个服务线程，超过上限的客户端收到 503 后改用轮询；
+    # 单个推送连接最长保持的秒数，到期由浏览器 EventSource 自动重连
+    SSE_MAX_SUBSCRIBERS = 48
+    SSE_MAX_LIFETIME = 300
+    SSE_RETRY_MS = 3000
+    # 生产模式 (--serve)：留给普通请求的线程数，waitress 总线程数 = 普通请求线程 + SSE 订阅上限，
+    # 推送连接占满时普通请求仍有线程可用；预派生进程数 (仅 POSIX)、空闲长连接超时 (秒)、最大并发连接数、监听队列长度
+    PORT = 5001
+    SERVE_REQUEST_THREADS = 16
+    SERVE_THREADS = SERVE_REQUEST_THREADS + SSE_MAX_SUBSCRIBERS
+    SERVE_WORKERS = 1
+    SERVE_CHANNEL_TIMEOUT = 60
+    SERVE_CONNECTION_LIMIT = 200
+    SERVE_BACKLOG = 1024
+    # 数据库连接池：空闲连接上限 (与服务线程数一致，满负载时连接不会反复开关) 与连接级 PRAGMA 参数
+    DB_POOL_SIZE = SERVE_THREADS
+    DB_BUSY_TIMEOUT_MS = 5000
+    DB_CACHE_SIZE_KB = 16384
+    DB_MMAP_SIZE = 128 * 1024 * 1024
+    # 单写线程：写操作排队由一个连接串行执行，每批最多 WRITE_BATCH_MAX 个任务共用一次提交
+    WRITE_QUEUE = True
+    WRITE_BATCH_MAX = 64
+    WRITE_TIMEOUT = 30
+    # 响应压缩：小于阈值的响应不压缩 (压缩收益抵不过 CPU 与头部开销)
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 5
+    COMPRESS_MIMETYPES = {'application/json', 'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript'}
+    # 静态资源指纹与预压缩：输出目录 (含 manifest.json)、浏览器缓存时长 (秒)、离线压缩级别 (只在内容变化时压一次)
+    ASSET_DIR = os.path.join(DATA_DIR, 'assets')
+    ASSET_MAX_AGE = 365 * 24 * 3600
+    ASSET_GZIP_LEVEL = 9
+    ASSET_BROTLI_QUALITY = 11
 
 app = Flask(__name__)
 app.config.from_object(Config)
 app.secret_key = Config.SECRET_KEY
 CORS(app)
 
+# --- 1.1 JSON 序列化与响应压缩 ---
+class RowJSONProvider(DefaultJSONProvider):
+    """可直接序列化 sqlite3.Row 的 JSON 提供者：装有 orjson 时用 orjson，否则回退标准库"""
+    ensure_ascii = False  # 中文按 UTF-8 原样输出，比 \uXXXX 转义少一半字节
+    sort_keys = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, sqlite3.Row): return dict(zip(o.keys(), o))
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs: return super().dumps(obj, **kwargs)
+        return self._dumps_bytes(obj).decode()
+
+    def _dumps_bytes(self, obj):
+        if orjson is None: return super().dumps(obj).encode()
+        # 日期时间交给 default，保持与 Flask 默认格式一致
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps_bytes(obj), mimetype='application/json')
+
+app.json = RowJSONProvider(app)
+
+_compressed_cache = {}  # (路径, ETag, 编码) -> 压缩后的响应体
+
+@app.after_request
+def compress_response(resp):
+    """按 Accept-Encoding 协商压缩 (brotli 优先，其次 gzip)；文件下载与 SSE 流不处理"""
+    if (resp.status_code != 200 or resp.direct_passthrough or resp.is_streamed
+            or resp.mimetype not in Config.COMPRESS_MIMETYPES or 'Content-Encoding' in resp.headers):
+        return resp
+    resp.vary.add('Accept-Encoding')
+    if brotli is not None and request.accept_encodings['br']: encoding = 'br'
+    elif request.accept_encodings['gzip']: encoding = 'gzip'
+    else: return resp
+    data = resp.get_data()
+    if len(data) < Config.COMPRESS_MIN_SIZE: return resp
+    # 带代次 ETag 的响应在代次不变时内容不变，压缩结果可以复用 (排行榜命中缓存时，压缩比查询还贵)
+    etag = resp.headers.get('ETag')
+    key = (request.full_path, etag, encoding)
+    compressed = _compressed_cache.get(key) if etag else None
+    if compressed is None:
+        if encoding == 'br': compressed = brotli.compress(data, quality=Config.COMPRESS_BROTLI_QUALITY)
+        else: compressed = gzip.compress(data, compresslevel=Config.COMPRESS_GZIP_LEVEL)
+        if etag:
+            if len(_compressed_cache) >= 64: _compressed_cache.clear()
+            _compressed_cache[key] = compressed
+    resp.set_data(compressed)
+    resp.headers['Content-Encoding'] = encoding
+    return resp
+
+# --- 1.2 冷启动计时 ---
+# pyngrok、openpyxl、waitress 都在首次用到时才导入；逐个模块的导入耗时见 bench/bench_startup.py
+startup_marks = [('导入与创建应用', time.perf_counter())]
+
+def startup_mark(stage):
+    startup_marks.append((stage, time.perf_counter()))
+
+@app.after_request
+def report_startup(resp):
+    """第一个请求返回时打印一次各阶段耗时 (从开始导入 app 模块算起)"""
+    if startup_marks[-1][0] != '首个请求':
+        startup_mark('首个请求')
+        prev, parts = STARTUP_T0, []
+        for stage, t in startup_marks:
+            parts.append(f'{stage} {(t - prev) * 1000:.0f}ms')
+            prev = t
+        print(f"启动耗时 {(prev - STARTUP_T0) * 1000:.0f}ms: " + ', '.join(parts))
+    return resp
+
+# 上传目录与 ngrok 目录在首次用到时再建
 os.makedirs(Config.DATA_DIR, exist_ok=True)
-os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(Config.NGROK_BIN_DIR, exist_ok=True)
-conf.get_default().ngrok_path = os.path.join(Config.NGROK_BIN_DIR, "ngrok.exe")
+
+# --- 1.3 静态资源 (指纹文件名与预压缩) ---
+class AssetManifest:
+    """启动时把 static/ 下的资源按内容哈希复制成 css/style.<哈希>.css，并预先写好 .gz / .br 压缩副本。
+    模板里的 url_for('static', ...) 换成指纹地址，由 /assets/ 按 Accept-Encoding 直接发送压缩副本，
+    并标记 immutable，手机再次访问时不会重新下载。内容没变的文件不重复压缩；
+    输出写在数据目录下 (打包版的 static/ 在只读的临时解包目录里)，写不进去时退回系统临时目录"""
+    COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.map', '.html'}
+    SKIP_DIRS = {'uploads'}
+
+    def __init__(self, source):
+        self.source = source
+        self.out = None
+        self.files = {}     # 逻辑路径 -> 指纹路径
+        self.served = {}    # 指纹路径 -> 已有的压缩编码
+        self._lock = threading.Lock()
+        self._built = False
+
+    def _sources(self):
+        for root, dirs, names in os.walk(self.source):
+            dirs[:] = [d for d in dirs if d not in self.SKIP_DIRS and not d.startswith('.')]
+            for name in names:
+                if name.startswith('.'): continue
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, self.source).replace(os.sep, '/'), path
+
+    def _output_dir(self):
+        for path in (Config.ASSET_DIR, os.path.join(tempfile.gettempdir(), 'class-points-assets')):
+            try:
+                os.makedirs(path, exist_ok=True)
+                probe = tempfile.NamedTemporaryFile(dir=path, delete=True)
+                probe.close()
+                return path
+            except OSError:
+                continue
+        return None
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f: f.write(data)
+        os.replace(tmp, path)
+
+    def build(self):
+        """生成 (或校验) 指纹文件与压缩副本，返回清单 {逻辑路径: 指纹路径}；失败时清单为空，模板退回原始地址"""
+        with self._lock:
+            if self._built: return self.files
+            self._built = True
+            try:
+                self.out = self._output_dir()
+                if self.out is None: raise OSError('没有可写的资源目录')
+                manifest_path = os.path.join(self.out, 'manifest.json')
+                try:
+                    with open(manifest_path, encoding='utf-8') as f: old = json.load(f)
+                except (OSError, ValueError):
+                    old = {}
+                files, served = {}, {}
+                for logical, path in self._sources():
+                    with open(path, 'rb') as f: data = f.read()
+                    stem, ext = os.path.splitext(logical)
+                    hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+                    target = os.path.join(self.out, hashed)
+                    encodings = []
+                    if old.get('files', {}).get(logical) == hashed and os.path.exists(target):
+                        encodings = [e for e in old.get('encodings', {}).get(hashed, []) if os.path.exists(f'{target}.{e}')]
+                    else:
+                        self._write(target, data)
+                        if ext.lower() in self.COMPRESSIBLE:
+                            variants = {'gz': gzip.compress(data, compresslevel=Config.ASSET_GZIP_LEVEL, mtime=0)}
+                            if brotli is not None: variants['br'] = brotli.compress(data, quality=Config.ASSET_BROTLI_QUALITY)
+                            for enc, blob in variants.items():
+                                # 压不小的文件 (已压缩的图片等) 不留副本
+                                if len(blob) < len(data):
+                                    self._write(f'{target}.{enc}', blob)
+                                    encodings.append(enc)
+                    files[logical], served[hashed] = hashed, encodings
+                self._write(manifest_path, json.dumps({'files': files, 'encodings': served}, ensure_ascii=False, indent=1).encode())
+                # 清理旧版本的指纹文件
+                keep = {os.path.join(self.out, h + suffix).replace('/', os.sep) for h, encs in served.items() for suffix in [''] + [f'.{e}' for e in encs]}
+                keep.add(manifest_path)
+                for root, _, names in os.walk(self.out):
+                    for name in names:
+                        path = os.path.join(root, name)
+                        if path not in keep: os.remove(path)
+                self.files, self.served = files, served
+            except OSError as e:
+                print(f'⚠️ 静态资源预处理失败，改用原始文件: {e}')
+                self.files, self.served = {}, {}
+            return self.files
+
+    def url(self, filename):
+        hashed = self.build().get(filename)
+        return url_for('asset_file', filename=hashed) if hashed else None
+
+assets = AssetManifest(app.static_folder)
+# Windows 上 mimetypes 读注册表，.js 可能被认成 text/plain，浏览器会拒绝执行
+mimetypes.add_type('text/javascript', '.js')
+mimetypes.add_type('text/css', '.css')
+
+def asset_url_for(endpoint, **values):
+    """模板用的 url_for：静态资源有指纹版本时返回 /assets/ 地址"""
+    if endpoint == 'static' and set(values) == {'filename'}:
+        url = assets.url(values['filename'])
+        if url: return url
+    return url_for(endpoint, **values)
+
+app.jinja_env.globals['url_for'] = asset_url_for
+
+@app.route('/assets/<path:filename>')
+def asset_file(filename):
+    """指纹资源：文件名随内容变化，可以永久缓存；按 Accept-Encoding 发送预压缩副本"""
+    assets.build()
+    if filename not in assets.served: return jsonify({'error': '资源不存在'}), 404
+    encodings = assets.served[filename]
+    name, encoding = filename, None
+    if 'br' in encodings and request.accept_encodings['br']: encoding = 'br'
+    elif 'gz' in encodings and request.accept_encodings['gzip']: encoding = 'gz'
+    if encoding: name = f'{filename}.{encoding}'
+    resp = send_from_directory(assets.out, name, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                               max_age=Config.ASSET_MAX_AGE)
+    if encoding: resp.headers['Content-Encoding'] = 'gzip' if encoding == 'gz' else 'br'
+    if encodings: resp.vary.add('Accept-Encoding')
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
 
 # --- 2. 数据库初始化 (单班级闭环架构) ---
 def init_db():
     conn = sqlite3.connect(Config.DATABASE_PATH)
+    # 结构版本已是最新时跳过全部建表/建索引语句，启动只需读一次库头
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return
     c = conn.cursor()
     # 系统配置
     c.execute('CREATE TABLE IF NOT EXISTS system_config (id INTEGER PRIMARY KEY, class_name TEXT, teacher_name TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
@@ -54,31 +306,666 @@ def init_db():
     # 为学生表添加索引
     c.execute('CREATE INDEX IF NOT EXISTS idx_stu_group ON students(group_id)')
     
+    migrate_db(c)
     conn.commit()
     conn.close()
 
+# --- 2.1 结构迁移 (PRAGMA user_version 记录版本) ---
+SCHEMA_VERSION = 9
+# points_history.kind (v6) 记录来源：manual 普通申报, benchmark_bonus / benchmark_penalty 基本准则达标奖励与扣分,
+# quick 随机点名等快捷加分, auction / bounty / redemption 拍卖、悬赏、兑换 (花积分，不计入荣誉榜与违纪榜),
+# carryover 学期结转的上学期余额, opening 导入时的初始积分, adjustment 对账补记的差额 (同样不计入榜单)
+# 花积分与记账类的来源不算表现：荣誉榜、违纪榜、趋势图与悬赏进度都不计
+NON_EARNING_KINDS = ('auction', 'bounty', 'redemption', 'carryover', 'opening', 'adjustment')
+NON_EARNING_SQL = '(' + ', '.join(f"'{k}'" for k in NON_EARNING_KINDS) + ')'  # 触发器里只能写字面量
+
+def _bounty_match_sql(ph, day):
+    """某条积分记录 (别名 ph，日期表达式 day) 是否计入悬赏 b：表现类来源、理由在白名单内且落在起止日期内"""
+    return f"""b.status = 'active' AND {ph}.kind NOT IN {NON_EARNING_SQL}
+        AND (COALESCE(b.allowed_reasons, '') = '' OR instr(',' || b.allowed_reasons || ',', ',' || {ph}.reason || ',') > 0)
+        AND (COALESCE(b.start_date, '') = '' OR {day} >= b.start_date)
+        AND (COALESCE(b.end_date, '') = '' OR {day} <= b.end_date)
+        AND (b.type != 'group' OR s.group_id IS NOT NULL)"""
+
+def _bounty_progress_trigger_body(sign):
+    return f"""INSERT INTO bounty_progress (bounty_id, target_id, points)
+        SELECT b.id, CASE WHEN b.type = 'group' THEN s.group_id ELSE NEW.student_id END, {sign}NEW.change_amount
+        FROM bounties b JOIN students s ON s.id = NEW.student_id
+        WHERE {_bounty_match_sql('NEW', 'date(NEW.created_at)')}
+        ON CONFLICT(bounty_id, target_id) DO UPDATE SET points = points + excluded.points;"""
+
+def backfill_bounty_progress(c, bounty_id):
+    """按悬赏规则从历史记录重算进度 (开启悬赏与迁移时调用)"""
+    c.execute('DELETE FROM bounty_progress WHERE bounty_id = ?', (bounty_id,))
+    c.execute(f'''
+        INSERT INTO bounty_progress (bounty_id, target_id, points)
+        SELECT b.id, CASE WHEN b.type = 'group' THEN s.group_id ELSE ph.student_id END as target, SUM(ph.change_amount)
+        FROM bounties b JOIN points_history ph JOIN students s ON s.id = ph.student_id
+        WHERE b.id = ? AND ph.status = 'approved' AND ph.change_amount > 0
+          AND {_bounty_match_sql('ph', 'ph.created_date')}
+        GROUP BY target
+    ''', (bounty_id,))
+
+def _daily_rollup_columns(ph, sign=''):
+    """积分记录 ph 在 points_daily 中对应的一行 (sign 为 '-' 时是撤销)：理由前缀 '[区域/类别] 名称' 拆成两列，没有前缀时为空串"""
+    tag = f"(CASE WHEN {ph}.reason LIKE '[%]%' THEN substr({ph}.reason, 2, instr({ph}.reason, ']') - 2) ELSE '' END)"
+    return f"""{ph}.student_id AS student_id, COALESCE({ph}.created_date, date({ph}.created_at)) AS day, {ph}.kind AS kind,
+            CASE WHEN instr({tag}, '/') THEN substr({tag}, 1, instr({tag}, '/') - 1) ELSE {tag} END AS area,
+            CASE WHEN instr({tag}, '/') THEN substr({tag}, instr({tag}, '/') + 1) ELSE '' END AS category,
+            {sign}MAX({ph}.change_amount, 0) AS plus, {sign}MIN({ph}.change_amount, 0) AS minus, {sign}1 AS n"""
+
+def _daily_rollup_trigger_body(sign):
+    return f"""INSERT INTO points_daily (student_id, day, kind, area, category, plus, minus, count)
+        SELECT {_daily_rollup_columns('OLD' if sign else 'NEW', sign)}
+        ON CONFLICT DO UPDATE SET plus = plus + excluded.plus, minus = minus + excluded.minus, count = count + excluded.count;"""
+
+def _add_column(c, table, name, decl):
+    cols = {r[1] for r in c.execute(f'PRAGMA table_info({table})').fetchall()}
+    if name not in cols: c.execute(f'ALTER TABLE {table} ADD COLUMN {name} {decl}')
+
+def migrate_db(c):
+    """按版本号逐级升级旧数据库，每一步都可重复执行"""
+    version = c.execute('PRAGMA user_version').fetchone()[0]
+    if version < 1:
+        # v1: 日历日期列，替代 date(created_at) 让按天统计走索引
+        _add_column(c, 'points_history', 'created_date', 'TEXT')
+        c.execute('UPDATE points_history SET created_date = date(created_at) WHERE created_date IS NULL')
+        # 本程序的写入都直接带上 created_date (见 LEDGER_INSERT)，插入触发器只给没写这一列的旧代码与外部脚本兜底，
+        # 否则每插一行都要再 UPDATE 一次
+        c.execute('''CREATE TRIGGER IF NOT EXISTS trg_ph_created_date AFTER INSERT ON points_history
+                     WHEN NEW.created_date IS NULL BEGIN UPDATE points_history SET created_date = date(NEW.created_at) WHERE id = NEW.id; END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS trg_ph_created_date_upd AFTER UPDATE OF created_at ON points_history
+                     BEGIN UPDATE points_history SET created_date = date(NEW.created_at) WHERE id = NEW.id; END''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_ph_date_status ON points_history(created_date, status)')
+    if version < 2:
+        # v2: 竞价日志，每次出价 (含被拒绝的) 都留痕
+        c.execute('CREATE TABLE IF NOT EXISTS bids (id INTEGER PRIMARY KEY AUTOINCREMENT, auction_id INTEGER, student_id INTEGER, amount INTEGER, accepted INTEGER DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_bids_auction ON bids(auction_id, id)')
+    if version < 3:
+        # v3: 悬赏进度表，由触发器在积分记录生效 (或撤销) 的同一事务内增量维护 (触发器按 kind 过滤，v9 创建)
+        c.execute('CREATE TABLE IF NOT EXISTS bounty_progress (bounty_id INTEGER, target_id INTEGER, points INTEGER DEFAULT 0, PRIMARY KEY (bounty_id, target_id))')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_bp_top ON bounty_progress(bounty_id, points)')
+    if version < 4:
+        # v4: 游标分页的排序键索引，第 N 页与第 1 页代价相同
+        c.execute('CREATE INDEX IF NOT EXISTS idx_stu_name_id ON students(name, id)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_ph_status_created ON points_history(status, created_at, id)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_ph_student_created ON points_history(student_id, status, created_at, id)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_rewards_created ON rewards(created_at, id)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_rewards_grocery_created ON rewards(is_grocery, created_at, id)')
+    if version < 5:
+        # v5: 排名顺序索引，单个学生的名次只需计数排在前面的人
+        c.execute('CREATE INDEX IF NOT EXISTS idx_stu_rank ON students(points DESC, name, id)')
+    if version < 6:
+        # v6: 记录来源类型列，旧数据按理由文本回填 (与各写入点的规则一致)
+        _add_column(c, 'points_history', 'kind', "TEXT NOT NULL DEFAULT 'manual'")
+        c.execute('''UPDATE points_history SET kind = CASE
+                         WHEN reason LIKE '[基本准则]%' THEN 'benchmark_bonus'
+                         WHEN change_amount < 0 AND (reason LIKE '[学业管理%' OR reason LIKE '[班级管理%') THEN 'benchmark_penalty'
+                         WHEN reason LIKE '拍卖%' THEN 'auction'
+                         WHEN reason LIKE '达成悬赏%' OR teacher = '悬赏结项' THEN 'bounty'
+                         WHEN reason LIKE '兑换%' THEN 'redemption'
+                         WHEN reason LIKE '[互动管理/随机点名]%' THEN 'quick'
+                         ELSE 'manual' END''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_ph_kind_date ON points_history(kind, created_date, created_at)')
+    if version < 7:
+        # v7: 对账检查点。ledger_sums 是截至 last_id 的已生效流水合计；检查点之前的旧记录再被改动 (审核通过、删除)
+        # 时由触发器把差额记进 ledger_changes，下次对账只需看新记录与这张表
+        c.execute('CREATE TABLE IF NOT EXISTS ledger_checkpoint (id INTEGER PRIMARY KEY CHECK (id = 1), last_id INTEGER NOT NULL, checked_at TEXT)')
+        c.execute('CREATE TABLE IF NOT EXISTS ledger_sums (student_id INTEGER PRIMARY KEY, total INTEGER NOT NULL)')
+        c.execute('CREATE TABLE IF NOT EXISTS ledger_changes (id INTEGER PRIMARY KEY, student_id INTEGER, delta INTEGER)')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS trg_ledger_update AFTER UPDATE OF status, change_amount, student_id ON points_history
+                     WHEN OLD.id <= (SELECT last_id FROM ledger_checkpoint)
+                      AND (OLD.status IS NOT NEW.status OR OLD.change_amount IS NOT NEW.change_amount OR OLD.student_id IS NOT NEW.student_id)
+                     BEGIN INSERT INTO ledger_changes (student_id, delta)
+                           SELECT OLD.student_id, -OLD.change_amount WHERE OLD.status = 'approved'
+                           UNION ALL SELECT NEW.student_id, NEW.change_amount WHERE NEW.status = 'approved'; END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS trg_ledger_delete AFTER DELETE ON points_history
+                     WHEN OLD.status = 'approved' AND OLD.id <= (SELECT last_id FROM ledger_checkpoint)
+                     BEGIN INSERT INTO ledger_changes (student_id, delta) VALUES (OLD.student_id, -OLD.change_amount); END''')
+        # 旧版拍卖、悬赏结项写的是待审核记录，但积分当场就扣了；改为已生效，流水合计才与余额一致
+        c.execute("UPDATE points_history SET status = 'approved' WHERE kind IN ('auction', 'bounty') AND status != 'approved'")
+        c.execute("UPDATE points_history SET kind = 'opening' WHERE reason = '初始积分' AND teacher = '系统' AND kind = 'manual'")
+    if version < 8:
+        # v8: 学生每日汇总 (按来源与理由的区域/类别分开计加分、扣分与条数)，趋势图不再扫明细账。
+        # 已生效的记录写入、审核通过或撤销时由触发器同步维护；流水只在学期结转/重置时整表清空，汇总表随之清空
+        c.execute('''CREATE TABLE IF NOT EXISTS points_daily (
+                         student_id INTEGER NOT NULL, day TEXT NOT NULL, kind TEXT NOT NULL, area TEXT NOT NULL, category TEXT NOT NULL,
+                         plus INTEGER NOT NULL DEFAULT 0, minus INTEGER NOT NULL DEFAULT 0, count INTEGER NOT NULL DEFAULT 0,
+                         PRIMARY KEY (student_id, day, kind, area, category)) WITHOUT ROWID''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_daily_insert AFTER INSERT ON points_history
+                     WHEN NEW.status = 'approved' BEGIN {_daily_rollup_trigger_body('')} END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_daily_approve AFTER UPDATE OF status ON points_history
+                     WHEN NEW.status = 'approved' AND OLD.status IS NOT 'approved' BEGIN {_daily_rollup_trigger_body('')} END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_daily_revoke AFTER UPDATE OF status ON points_history
+                     WHEN OLD.status = 'approved' AND NEW.status IS NOT 'approved' BEGIN {_daily_rollup_trigger_body('-')} END''')
+        c.execute('DELETE FROM points_daily')
+        c.execute(f'''INSERT INTO points_daily (student_id, day, kind, area, category, plus, minus, count)
+                     SELECT student_id, day, kind, area, category, SUM(plus), SUM(minus), SUM(n)
+                     FROM (SELECT {_daily_rollup_columns('ph')} FROM points_history ph WHERE ph.status = 'approved')
+                     GROUP BY 1, 2, 3, 4, 5''')
+    if version < 9:
+        # v9: 悬赏进度不计花积分与记账类来源 (对账补记、导入初始积分等)，重建触发器并按新规则回填进行中的悬赏
+        for name in ('trg_bp_insert', 'trg_bp_approve', 'trg_bp_revoke'):
+            c.execute(f'DROP TRIGGER IF EXISTS {name}')
+        c.execute(f'''CREATE TRIGGER trg_bp_insert AFTER INSERT ON points_history
+                     WHEN NEW.status = 'approved' AND NEW.change_amount > 0
+                     BEGIN {_bounty_progress_trigger_body('')} END''')
+        c.execute(f'''CREATE TRIGGER trg_bp_approve AFTER UPDATE OF status ON points_history
+                     WHEN NEW.status = 'approved' AND OLD.status IS NOT 'approved' AND NEW.change_amount > 0
+                     BEGIN {_bounty_progress_trigger_body('')} END''')
+        c.execute(f'''CREATE TRIGGER trg_bp_revoke AFTER UPDATE OF status ON points_history
+                     WHEN OLD.status = 'approved' AND NEW.status IS NOT 'approved' AND NEW.change_amount > 0
+                     BEGIN {_bounty_progress_trigger_body('-')} END''')
+        for (bid,) in c.execute("SELECT id FROM bounties WHERE status = 'active'").fetchall():
+            backfill_bounty_progress(c, bid)
+    if version < SCHEMA_VERSION:
+        c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+class PooledConnection(sqlite3.Connection):
+    """连接池中的连接：close() 只是归还连接池，不真正关闭"""
+    pool = None
+
+    def close(self):
+        if self.pool is not None: self.pool.release(self)
+        else: super().close()
+
+    def discard(self):
+        super().close()
+
+class ConnectionPool:
+    """SQLite 连接池：连接只做一次 PRAGMA 调优，随后跨请求复用"""
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._leases = itertools.count(1)
+        self._ready = False
+
+    def _prepare(self):
+        # 首次取连接时建库并切换 WAL (WAL 模式会持久化到数据库文件)
+        with self._lock:
+            if self._ready: return
+            init_db()
+            conn = sqlite3.connect(self.path, timeout=Config.DB_BUSY_TIMEOUT_MS / 1000)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.close()
+            self._ready = True
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=Config.DB_BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False, factory=PooledConnection)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(Config.DB_BUSY_TIMEOUT_MS)}')
+        conn.execute(f'PRAGMA cache_size=-{int(Config.DB_CACHE_SIZE_KB)}')
+        conn.execute(f'PRAGMA mmap_size={int(Config.DB_MMAP_SIZE)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        if not self._ready: self._prepare()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        # 每次借出都换一个租约号，防止已归还并被他人借走的连接被重复归还
+        conn.lease = next(self._leases)
+        conn.released = False
+        return conn
+
+    def release(self, conn):
+        if getattr(conn, 'released', True): return
+        conn.released = True
+        try:
+            # 未提交的事务一律回滚，避免把写锁带回池中
+            if conn.in_transaction: conn.rollback()
+        except sqlite3.Error:
+            conn.discard()
+            return
+        if self._idle.qsize() < self.size: self._idle.put(conn)
+        else: conn.discard()
+
+    def close_all(self):
+        while True:
+            try: self._idle.get_nowait().discard()
+            except queue.Empty: break
+
+db_pool = ConnectionPool(Config.DATABASE_PATH, Config.DB_POOL_SIZE)
+
 def get_db_connection():
-    if not os.path.exists(Config.DATABASE_PATH): init_db()
-    conn = sqlite3.connect(Config.DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
+    # 请求内取出的连接登记到 g，请求结束时统一归还 (即使路由忘记 close)
+    try: g.setdefault('db_conns', []).append((conn, conn.lease))
+    except RuntimeError: pass
     return conn
 
+@app.teardown_appcontext
+def release_db_connections(exc):
+    for conn, lease in g.pop('db_conns', []):
+        if conn.lease == lease: db_pool.release(conn)
+
+# --- 2.3 写入代次与排行榜缓存 ---
+class WriteGenerations:
+    """按数据类别计数的写入代次：写操作提交后递增，读缓存据此判断是否过期"""
+    FAMILIES = ('points', 'standards', 'rewards', 'system')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._gens = {}
+        self._shared = None
+
+    def share(self):
+        """预派生 worker 前调用：代次改存共享内存，任一进程写入后所有进程的 ETag 与排行榜缓存一起失效"""
+        import multiprocessing
+        ctx = multiprocessing.get_context('fork')
+        self._shared = ctx.RawArray('q', [self._gens.get(f, 0) for f in self.FAMILIES])
+        self._lock = ctx.Lock()
+
+    def bump(self, family):
+        with self._lock:
+            if self._shared is not None: self._shared[self.FAMILIES.index(family)] += 1
+            else: self._gens[family] = self._gens.get(family, 0) + 1
+
+    def get(self, family):
+        if self._shared is not None: return self._shared[self.FAMILIES.index(family)]
+        return self._gens.get(family, 0)
+
+generations = WriteGenerations()
+
+class RankingCache:
+    """排行榜结果缓存：只保留当前代次的结果 (代次一变整体作废)，条目数有上限，超出时淘汰最久未用的"""
+    def __init__(self, size=32):
+        self.size = size
+        self._gen = None
+        self._items = collections.OrderedDict()  # (type, start_date, end_date) -> JSON 文本
+        self._lock = threading.Lock()
+
+    def get(self, key, gen):
+        with self._lock:
+            if gen != self._gen: return None
+            body = self._items.get(key)
+            if body is not None: self._items.move_to_end(key)
+            return body
+
+    def put(self, key, gen, body):
+        with self._lock:
+            # 查询期间代次已经前进，结果是旧的，不入缓存
+            if self._gen is not None and gen < self._gen: return
+            if gen != self._gen:
+                self._items.clear()
+                self._gen = gen
+            self._items[key] = body
+            self._items.move_to_end(key)
+            while len(self._items) > self.size: self._items.popitem(last=False)
+
+_ranking_cache = RankingCache()
+
+def bump_points_generation():
+    """学生积分、已生效的积分记录或排行榜名单发生变化后调用"""
+    generations.bump('points')
+    broker.publish('ranking', {'generation': generations.get('points')})
+
+# 代次只存在内存里，重启后从 0 重新计数；ETag 带上启动标识，避免旧 ETag 误命中
+BOOT_ID = uuid.uuid4().hex[:8]
+
+def conditional(*families):
+    """GET 接口的条件请求：ETag 由相关数据类别的写入代次拼成，
+    If-None-Match 命中时直接返回 304，不访问数据库"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET': return view(*args, **kwargs)
+            tag = BOOT_ID + '-' + '.'.join(str(generations.get(f)) for f in families)
+            if request.if_none_match.contains_weak(tag):
+                resp = app.response_class(status=304)
+            else:
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200: return resp
+            resp.set_etag(tag, weak=True)
+            # 浏览器每次都带 If-None-Match 回来校验，保证写入后立即看到新数据
+            resp.headers['Cache-Control'] = 'private, no-cache'
+            return resp
+        return wrapper
+    return decorator
+
+# --- 2.4 实时推送 (Server-Sent Events) ---
+class EventBroker:
+    """进程内发布/订阅：每个订阅者一个有界队列，慢客户端只丢弃最旧的消息；订阅数有上限"""
+    TOPICS = ('auction', 'bounties', 'events', 'ranking')
+
+    def __init__(self, max_subscribers, queue_size=100):
+        self._lock = threading.Lock()
+        self._subs = {}  # queue -> 订阅的主题集合
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+
+    def subscribe(self, topics):
+        """订阅已满时返回 None"""
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if len(self._subs) >= self.max_subscribers: return None
+            self._subs[q] = set(topics)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock: self._subs.pop(q, None)
+
+    def publish(self, topic, data):
+        msg = f"event: {topic}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        with self._lock: targets = [q for q, topics in self._subs.items() if topic in topics]
+        for q in targets:
+            try:
+                q.put_nowait(msg)
+            except queue.Full:
+                try: q.get_nowait()
+                except queue.Empty: pass
+                try: q.put_nowait(msg)
+                except queue.Full: pass
+
+broker = EventBroker(Config.SSE_MAX_SUBSCRIBERS)
+
+@app.route('/api/stream')
+def event_stream():
+    """SSE 推送通道：?topics=auction,bounties,events,ranking。
+    订阅已满时返回 503 (EventSource 收到非 200 不会自动重连，页面据此退回轮询)；
+    连接保持 SSE_MAX_LIFETIME 秒后由服务端结束，浏览器按 retry 间隔重连，线程不会被一个标签页永久占住"""
+    topics = [t for t in request.args.get('topics', '').split(',') if t in EventBroker.TOPICS] or list(EventBroker.TOPICS)
+    q = broker.subscribe(topics)
+    if q is None:
+        resp = jsonify({'error': '实时推送连接已满，请改用轮询', 'retry': 60})
+        resp.status_code = 503
+        resp.headers['Retry-After'] = '60'
+        return resp
+    deadline = time.monotonic() + Config.SSE_MAX_LIFETIME
+
+    def stream():
+        yield f'retry: {Config.SSE_RETRY_MS}\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: return
+            try:
+                yield q.get(timeout=min(15, remaining))
+            except queue.Empty:
+                yield ': ping\n\n'  # 心跳，防止隧道/代理断开空闲连接
+
+    resp = Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # 服务器关闭响应时退订；客户端在第一次读取前就断开时生成器的 finally 不会执行，这里仍会执行
+    resp.call_on_close(lambda: broker.unsubscribe(q))
+    return resp
+
+# --- 2.5 游标分页 (?limit=&after=) ---
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(token, types):
+    """types 为排序键各列的类型，如 (str, int)；个数或类型对不上的游标一律视为无效 (路由返回 400)"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except Exception:
+        raise ValueError('无效的分页游标')
+    if (not isinstance(values, list) or len(values) != len(types)
+            or any(type(v) is not t for v, t in zip(values, types))):
+        raise ValueError('无效的分页游标')
+    return values
+
+def page_request(key_types, default_limit=None):
+    """解析分页参数，返回 (limit, after 键值)；未传 limit 且无默认值时返回 (None, None) 表示不分页"""
+    limit = request.args.get('limit', type=int) or default_limit
+    if not limit: return None, None
+    after = request.args.get('after')
+    return max(1, min(limit, MAX_PAGE_SIZE)), (decode_cursor(after, key_types) if after else None)
+
+def page_result(rows, limit, key):
+    """rows 多取了一行用于判断是否还有下一页；key(row) 给出排序键"""
+    items = rows[:limit]
+    next_cursor = encode_cursor(list(key(rows[limit - 1]))) if len(rows) > limit else None
+    return items, next_cursor
+
+# --- 2.6 单写线程 (group commit) ---
+class WriteBusy(Exception):
+    """写任务排队超时并已撤销：写入确定没有执行，调用方可以放心重试"""
+
+class WriteQueue:
+    """所有写操作排队交给一个持有专用连接的线程执行，读请求仍走连接池并发读 WAL 快照。
+    写线程一次取出队列里积压的任务 (最多 batch_max 个) 放进同一个事务，每个任务包在自己的 SAVEPOINT 里：
+    任务失败只回滚它自己，整批只提交一次 (group commit)。调用方通过 Future 拿到任务返回值或异常。
+    任务函数形如 fn(conn, *args)，只管执行语句，不要自己 commit/rollback。
+    独占任务 (run_exclusive) 不进批次：写线程先提交手头的批次，再单独执行它，期间后续写任务在队列里排队而不是在 SQLite 锁上等待。"""
+    def __init__(self, pool, batch_max):
+        self.pool = pool
+        self.batch_max = batch_max
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0  # 已提交批次数 (压测观察 group commit 效果)
+        self.jobs = 0
+
+    def submit(self, fn, *args, exclusive=False):
+        fut = Future()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='db-writer', daemon=True)
+                self._thread.start()
+        self._queue.put((fn, args, fut, exclusive))
+        return fut
+
+    def run(self, fn, *args):
+        """提交写任务并等待结果；关闭 WRITE_QUEUE 时退回为请求线程自己开事务写入。
+        排队超过 WRITE_TIMEOUT 仍未轮到 (如学期结转独占写线程) 就撤销任务并抛 WriteBusy；已开始执行的任务等它提交完，
+        否则调用方收到失败、写入却随后落盘，重试就会重复记账"""
+        if not Config.WRITE_QUEUE: return self._run_direct(fn, *args)
+        fut = self.submit(fn, *args)
+        try:
+            return fut.result(timeout=Config.WRITE_TIMEOUT)
+        except FutureTimeout:
+            if fut.cancel(): raise WriteBusy('写入排队超时，本次操作未执行，请稍后重试') from None
+            return fut.result()
+
+    def run_exclusive(self, fn, *args):
+        """在写线程上独占执行 fn(conn, *args) 并等待结果 (不设超时)。
+        连接处于自动提交模式，事务由 fn 自己 BEGIN/COMMIT，可以执行 VACUUM 这类不能放进事务的语句"""
+        if not Config.WRITE_QUEUE:
+            if not self.pool._ready: self.pool._prepare()
+            conn = self.pool._connect()
+            conn.pool = None
+            conn.isolation_level = None
+            try:
+                return self._run_alone(conn, fn, args)
+            finally:
+                conn.close()
+        return self.submit(fn, *args, exclusive=True).result()
+
+    def execute(self, sql, params=()):
+        """单条写语句的便捷入口，返回 (lastrowid, rowcount)"""
+        def job(conn):
+            cur = conn.execute(sql, params)
+            return cur.lastrowid, cur.rowcount
+        return self.run(job)
+
+    def stop(self):
+        """处理完已排队的任务后停止写线程 (下次提交会重新拉起，并按当前库路径重连)"""
+        thread = self._thread
+        if thread and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+
+    def _run_direct(self, fn, *args):
+        conn = self.pool.acquire()
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.release(conn)
+
+    def _loop(self):
+        if not self.pool._ready: self.pool._prepare()
+        conn = self.pool._connect()
+        conn.pool = None
+        conn.isolation_level = None  # 事务由写线程显式控制
+        # 每个任务都在 SAVEPOINT 里，语句日志放内存 (temp_store=MEMORY) 时多行写入会慢一个数量级，写连接改回临时文件
+        conn.execute('PRAGMA temp_store=DEFAULT')
+        held = collections.deque()  # 凑批时取到的停止信号或独占任务，留到这一批提交后再处理 (保持顺序)
+        try:
+            while True:
+                item = held.popleft() if held else self._queue.get()
+                if item is None: return
+                fn, args, fut, exclusive = item
+                if exclusive:
+                    if fut.set_running_or_notify_cancel():
+                        try: fut.set_result(self._run_alone(conn, fn, args))
+                        except Exception as e: fut.set_exception(e)
+                    continue
+                batch = [item]
+                while len(batch) < self.batch_max:
+                    try: item = self._queue.get_nowait()
+                    except queue.Empty: break
+                    if item is None or item[3]:
+                        held.append(item)  # 先把这一批做完再退出或执行独占任务
+                        break
+                    batch.append(item)
+                self._commit_batch(conn, [(fn, args, fut) for fn, args, fut, _ in batch if fut.set_running_or_notify_cancel()])
+        finally:
+            conn.close()
+
+    def _run_alone(self, conn, fn, args):
+        try:
+            return fn(conn, *args)
+        finally:
+            # fn 抛异常时可能留下未结束的事务，回滚后写连接才能继续处理后续批次
+            if conn.in_transaction: conn.execute('ROLLBACK')
+
+    def _commit_batch(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for fn, args, fut in batch:
+                conn.execute('SAVEPOINT job')
+                try:
+                    outcomes.append((fut, fn(conn, *args), None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO job')
+                    outcomes.append((fut, None, e))
+                conn.execute('RELEASE job')
+            conn.execute('COMMIT')
+        except Exception as e:
+            # 提交失败 (如磁盘满、锁等待超时)：整批作废，每个调用方都收到异常
+            if conn.in_transaction: conn.execute('ROLLBACK')
+            for _, _, fut in batch: fut.set_exception(e)
+            return
+        self.batches += 1
+        self.jobs += len(batch)
+        # 提交成功后才交付结果，调用方拿到返回值时数据已落盘
+        for fut, result, error in outcomes:
+            if error is not None: fut.set_exception(error)
+            else: fut.set_result(result)
+
+writer = WriteQueue(db_pool, Config.WRITE_BATCH_MAX)
+
+@app.errorhandler(WriteBusy)
+def write_busy(e):
+    # 兜住所有异常的接口需先 except WriteBusy: raise，才能走到这里返回 503
+    resp = jsonify({'error': str(e)})
+    resp.status_code = 503
+    resp.headers['Retry-After'] = '5'
+    return resp
+
+# --- 2.7 积分记账 (所有余额变动的统一入口) ---
+LEDGER_INSERT = '''
+    INSERT INTO points_history (student_id, change_amount, reason, teacher, status, kind, created_at, created_date)
+    SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]'), ?, ?, ?, t.at, date(t.at)
+    FROM (SELECT COALESCE(?, CURRENT_TIMESTAMP) AS at) AS t, json_each(?) ORDER BY key
+'''
+
+def apply_balance_deltas(conn, deltas):
+    """deltas 为 [(student_id, 变动)] (同一学生可出现多次)：在 SQL 里按学生汇总，一条 UPDATE ... FROM 调整余额。
+    返回 {student_id: 新余额}，不存在的学生不会出现在结果里"""
+    rows = conn.execute('''
+        UPDATE students SET points = points + d.delta
+        FROM (SELECT json_extract(value, '$[0]') AS sid, SUM(json_extract(value, '$[1]')) AS delta
+              FROM json_each(?) GROUP BY 1) AS d
+        WHERE students.id = d.sid
+        RETURNING students.id, students.points
+    ''', (json.dumps(deltas),)).fetchall()
+    return {r['id']: r['points'] for r in rows}
+
+def post_ledger(conn, entries, teacher='系统', kind='manual', status='approved', created_at=None):
+    """记账：entries 为 [(student_id, 变动, 理由)]，整批作为 JSON 数组一条 INSERT ... SELECT 写入流水；
+    状态为 approved 时再用一条汇总 UPDATE 调整余额 (待审核的记录等审核通过时才计入)。
+    须在写线程任务内调用，与调用方同一事务。返回 (新流水 ID 列表, {student_id: 新余额})；
+    有学生不存在时抛 ValueError，整个任务回滚"""
+    if not entries: return [], {}
+    last = conn.execute(LEDGER_INSERT, (teacher, status, kind, created_at, json.dumps(entries))).lastrowid
+    # 写线程独占写锁，同一条语句按数组顺序分配的自增 ID 是连续的
+    ids = list(range(last - len(entries) + 1, last + 1))
+    if status != 'approved': return ids, {}
+    balances = apply_balance_deltas(conn, [(sid, delta) for sid, delta, _ in entries])
+    missing = {sid for sid, _, _ in entries} - balances.keys()
+    if missing: raise ValueError(f'学生不存在: {sorted(missing)}')
+    return ids, balances
+
 # --- 3. 内网穿透 (Ngrok 集成) ---
+class LogRing:
+    """有界日志环形缓冲：每行带单调递增的序号，读者按 since 只取新增的行，没有新行时可挂起等待 (长轮询)。
+    pyngrok 的日志回调线程与请求线程共用，读写都在同一把锁下进行"""
+    def __init__(self, size=200):
+        self._lines = collections.deque(maxlen=size)
+        self._cond = threading.Condition()
+        self.seq = 0
+        self._cleared = 0  # 最近一次清空时的序号
+
+    def append(self, msg):
+        with self._cond:
+            self.seq += 1
+            self._lines.append({'seq': self.seq, 'time': datetime.now().strftime('%H:%M:%S'), 'msg': msg})
+            self._cond.notify_all()
+
+    def clear(self):
+        """清空已有的行；序号继续递增，读者手里的游标仍然有效"""
+        with self._cond:
+            self._lines.clear()
+            self._cleared = self.seq
+
+    def since(self, seq, wait=0):
+        """返回 (最新序号, 序号大于 seq 的行, 是否有断档)；暂无新行时最多等待 wait 秒。
+        断档指中间有行已被清空或挤出缓冲，读者应先清屏再追加"""
+        with self._cond:
+            # 游标比当前序号还大说明服务重启过，从头返回
+            if seq > self.seq: seq = -1
+            if wait > 0: self._cond.wait_for(lambda: self.seq > seq, timeout=wait)
+            lines = [line for line in self._lines if line['seq'] > seq]
+            gap = seq < 0 or 0 < seq <= self._cleared or (bool(lines) and lines[0]['seq'] > seq + 1)
+            return self.seq, lines, gap
+
 current_online_url = None
-tunnel_logs = []
+tunnel_log = LogRing()
+
+def load_ngrok():
+    """首次开启隧道时才导入 pyngrok (连带 yaml 等依赖，放在模块顶部会拖慢冷启动)"""
+    from pyngrok import ngrok, conf
+    os.makedirs(Config.NGROK_BIN_DIR, exist_ok=True)
+    conf.get_default().ngrok_path = os.path.join(Config.NGROK_BIN_DIR, "ngrok.exe")
+    conf.get_default().log_event_callback = log_callback
+    return ngrok
 
 def log_callback(log):
-    global tunnel_logs
     line = str(log).strip()
     if "t=" in line:
         msg_match = re.search(r'msg="([^"]+)"', line)
-        if msg_match: tunnel_logs.append(msg_match.group(1))
-    else: tunnel_logs.append(line)
-    if len(tunnel_logs) > 20: tunnel_logs.pop(0)
+        if msg_match: tunnel_log.append(msg_match.group(1))
+    else: tunnel_log.append(line)
 
 @app.route('/api/tunnel/action', methods=['POST'])
 def tunnel_action():
-    global current_online_url, tunnel_logs
+    global current_online_url
     data = request.json
     action = data.get('action')
     token = data.get('token', '').strip()
@@ -86,9 +973,10 @@ def tunnel_action():
     token_file = os.path.join(Config.DATA_DIR, 'ngrok_token.txt')
     
     if action == 'start':
-        tunnel_logs = ["准备初始化 Ngrok..."]
+        tunnel_log.clear()
+        tunnel_log.append("准备初始化 Ngrok...")
         try:
-            conf.get_default().log_event_callback = log_callback
+            ngrok = load_ngrok()
             if token:
                 ngrok.set_auth_token(token)
                 with open(token_file, 'w') as f: f.write(token)
@@ -100,20 +988,21 @@ def tunnel_action():
                 return jsonify({'success': False, 'error': 'needs_token'})
 
             if not current_online_url:
-                tunnel_logs.append("正在启动隧道进程...")
-                current_online_url = ngrok.connect(5001).public_url
+                tunnel_log.append("正在启动隧道进程...")
+                current_online_url = ngrok.connect(Config.PORT).public_url
             return jsonify({'success': True, 'url': current_online_url})
         except Exception as e:
             error_msg = str(e)
-            tunnel_logs.append(f"错误: {error_msg}")
+            tunnel_log.append(f"错误: {error_msg}")
             if "authtoken" in error_msg.lower():
                 return jsonify({'success': False, 'error': 'invalid_token'})
             return jsonify({'success': False, 'error': error_msg})
     elif action == 'stop':
         try:
-            ngrok.kill()
+            load_ngrok().kill()
             current_online_url = None
-            tunnel_logs = ["隧道已关闭"]
+            tunnel_log.clear()
+            tunnel_log.append("隧道已关闭")
             return jsonify({'success': True})
         except: return jsonify({'success': False})
 
@@ -121,28 +1010,478 @@ def tunnel_action():
 def tunnel_status(): return jsonify({'active': current_online_url is not None, 'url': current_online_url})
 
 @app.route('/api/tunnel/logs')
-def get_tunnel_logs(): return jsonify(tunnel_logs)
+def get_tunnel_logs():
+    """隧道日志：?since=<序号> 只返回之后新增的行，&wait=<秒> 暂无新行时挂起等待 (最长 25 秒)"""
+    since = request.args.get('since', 0, type=int)
+    wait = min(max(request.args.get('wait', 0, type=float), 0), 25)
+    seq, lines, gap = tunnel_log.since(since, wait)
+    return jsonify({'seq': seq, 'lines': lines, 'gap': gap})
 
 @app.route('/api/system/reset', methods=['POST'])
 def system_reset():
     """彻底卸载系统：清空所有业务数据"""
+    def write(conn):
+        reset_ledger_checkpoint(conn)
+        for table in ['system_config', 'classes', 'groups', 'students', 'rewards'] + TERM_TABLES:
+            conn.execute(f'DELETE FROM {table}')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        tables = ['system_config', 'classes', 'groups', 'students', 'points_history', 
-                  'group_points_history', 'rewards', 'redemptions', 'group_redemptions', 
-                  'student_evaluations', 'auctions', 'bounties']
-        for table in tables:
-            cursor.execute(f'DELETE FROM {table}')
-        conn.commit()
-        conn.close()
+        writer.run(write)
+        for family in ('system', 'standards', 'rewards'): generations.bump(family)
+        bump_points_generation()
         return jsonify({'success': True})
+    except WriteBusy: raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# --- 3.1 学期归档 (结转后热表只保留本学期数据) ---
+# 学期结转时清空的流水类表；学生、小组、理由库、奖品与系统配置跨学期保留
+TERM_TABLES = ['points_history', 'group_points_history', 'redemptions', 'group_redemptions',
+               'auctions', 'bids', 'bounties', 'bounty_progress', 'points_daily']
+
+def archive_path(term):
+    """学期名只允许字母、数字、汉字、下划线与短横线，防止路径穿越"""
+    if not term or not re.fullmatch(r'[\w\-]{1,64}', term): raise ValueError('学期名称只能包含文字、数字、下划线和短横线')
+    return os.path.join(Config.ARCHIVE_DIR, f'{term}.db')
+
+def rollover_term(term, carry_balances=True):
+    """学期结转：把整库快照到归档库，再清空流水表；余额可选择结转或清零。
+    整个过程作为独占任务在写线程上执行，期间其它写请求在写队列里排队，不会因等锁超时而失败。"""
+    path = archive_path(term)
+    if os.path.exists(path): raise ValueError(f'学期 {term} 已归档')
+    os.makedirs(Config.ARCHIVE_DIR, exist_ok=True)
+    result = writer.run_exclusive(_rollover, term, path, carry_balances)
+    bump_points_generation()
+    return result
+
+def _snapshot(path):
+    """用 backup API 把最后一次提交的快照写到 path (先写临时文件再改名)"""
+    tmp = path + '.tmp'
+    src, dst = sqlite3.connect(_readonly_uri(Config.DATABASE_PATH), uri=True), sqlite3.connect(tmp)
+    try:
+        src.backup(dst)
+        # 归档库只读使用，改回回滚日志模式，打开时不会再生成 -wal/-shm 文件
+        dst.execute('PRAGMA journal_mode=DELETE')
+    except Exception:
+        dst.close()
+        os.remove(tmp)
+        raise
+    finally:
+        src.close(); dst.close()
+    os.replace(tmp, path)
+
+def _rollover(conn, term, path, carry_balances):
+    # 本进程的写入已被写队列挡住；快照在拿写锁之前做，拷贝大库期间不阻塞其它进程。
+    # 拿到写锁后用 data_version 确认快照之后没有别的连接提交过，否则重拍，几次都不成功就在写锁内拍
+    for _ in range(3):
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        _snapshot(path)
+        conn.execute('BEGIN IMMEDIATE')
+        if conn.execute('PRAGMA data_version').fetchone()[0] == version: break
+        conn.execute('ROLLBACK')
+    else:
+        conn.execute('BEGIN IMMEDIATE')
+        _snapshot(path)
+    try:
+        counts = {t: conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0] for t in TERM_TABLES}
+        reset_ledger_checkpoint(conn)
+        # 整表删除再按原定义重建 (连同索引与触发器)，比逐行 DELETE 快得多，也不会逐行触发流水触发器。
+        # 自增序号照旧保留，新学期的流水 id 不会与归档库里的重复
+        marks = ','.join('?' * len(TERM_TABLES))
+        schema = conn.execute(f"SELECT type, sql FROM sqlite_master WHERE tbl_name IN ({marks}) AND sql IS NOT NULL",
+                              TERM_TABLES).fetchall()
+        seqs = conn.execute(f'SELECT name, seq FROM sqlite_sequence WHERE name IN ({marks})', TERM_TABLES).fetchall()
+        for table in TERM_TABLES:
+            conn.execute(f'DROP TABLE {table}')
+        for kind in ('table', 'index', 'trigger'):
+            for row in schema:
+                if row['type'] == kind: conn.execute(row['sql'])
+        conn.executemany('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', [tuple(r) for r in seqs])
+        if carry_balances:
+            # 余额保留，并写一条结转记录，使新学期的流水合计仍等于余额
+            carried = conn.execute('''
+                INSERT INTO points_history (student_id, change_amount, reason, teacher, status, kind, created_date)
+                SELECT id, points, ?, '系统', 'approved', 'carryover', CURRENT_DATE FROM students WHERE points != 0
+            ''', (f'学期结转: {term}',)).rowcount
+        else:
+            conn.execute('UPDATE students SET points = 0')
+            carried = 0
+        conn.execute('COMMIT')
+    except Exception:
+        os.remove(path)  # 没清空成功，撤掉归档，允许重试
+        raise
+    # 归还删表后留下的空闲页，让数据库文件真正变小
+    conn.execute('VACUUM')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return {'term': term, 'archived_rows': counts, 'carried_students': carried}
+
+def _readonly_uri(path):
+    return pathlib.Path(path).resolve().as_uri() + '?mode=ro'
+
+def open_archive(term):
+    """只读打开当前库并以 ATTACH 挂载归档库 (别名 term)，用于跨学期的历史报表"""
+    path = archive_path(term)
+    if not os.path.exists(path): raise FileNotFoundError(f'学期 {term} 不存在')
+    conn = sqlite3.connect(_readonly_uri(Config.DATABASE_PATH), uri=True)
+    conn.row_factory = sqlite3.Row
+    conn.execute('ATTACH DATABASE ? AS term', (_readonly_uri(path),))
+    return conn
+
+@app.route('/api/system/rollover', methods=['POST'])
+def system_rollover():
+    """学期结转：归档本学期数据并清空流水"""
+    data = request.json or {}
+    try:
+        result = rollover_term(data.get('term', '').strip(), bool(data.get('carry_balances', True)))
+        return jsonify({'success': True, **result})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/archive/terms')
+def list_archived_terms():
+    """已归档的学期列表"""
+    if not os.path.isdir(Config.ARCHIVE_DIR): return jsonify([])
+    terms = []
+    for name in sorted(os.listdir(Config.ARCHIVE_DIR)):
+        if not name.endswith('.db'): continue
+        st = os.stat(os.path.join(Config.ARCHIVE_DIR, name))
+        terms.append({'term': name[:-3], 'size': st.st_size,
+                      'archived_at': datetime.fromtimestamp(st.st_mtime).strftime('%Y-%m-%d %H:%M:%S')})
+    return jsonify(terms)
+
+@app.route('/api/archive/<term>/report')
+def archived_term_report(term):
+    """归档学期的期末报表：学期末积分、加减分合计，并对照当前积分 (按学号关联)"""
+    try:
+        conn = open_archive(term)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    try:
+        rows = conn.execute('''
+            SELECT a.student_id, a.name, a.points as term_points,
+                   COALESCE(h.plus, 0) as plus, COALESCE(h.minus, 0) as minus, COALESCE(h.records, 0) as records,
+                   s.points as current_points
+            FROM term.students a
+            LEFT JOIN (SELECT student_id,
+                              SUM(CASE WHEN change_amount > 0 THEN change_amount ELSE 0 END) as plus,
+                              SUM(CASE WHEN change_amount < 0 THEN change_amount ELSE 0 END) as minus,
+                              COUNT(*) as records
+                       FROM term.points_history WHERE status = 'approved' GROUP BY student_id) h ON h.student_id = a.id
+            LEFT JOIN main.students s ON s.student_id = a.student_id
+            ORDER BY a.points DESC, a.name
+        ''').fetchall()
+        return jsonify({'term': term, 'students': rows})
+    finally:
+        conn.close()
+
+# --- 3.2 在线备份 ---
+class BackupRestarted(Exception):
+    pass
+
+class BackupManager:
+    """在线备份：用 backup API 分段拷贝页面，段与段之间休眠，课堂上的写入不会被卡住。
+    其他连接在拷贝途中提交写入会让 SQLite 从头重来；连续重来超过 max_restarts 次就改为一次拷完
+    (WAL 模式下一次性拷贝只占一个读快照，同样不阻塞写入)。拷贝完成后在副本上跑 integrity_check，
+    通过才改名为正式备份，并按保留份数轮换旧备份。"""
+    PREFIX = 'class_points-'
+
+    def __init__(self, max_restarts=3):
+        self.max_restarts = max_restarts
+        self._lock = threading.Lock()
+        self.running = False
+        self.progress = None  # (剩余页数, 总页数)
+        self.last = None      # 最近一次备份结果
+        self._scheduler = None
+
+    def start(self, trigger='manual'):
+        """在后台线程开始一次备份；已有备份在跑时返回 False"""
+        with self._lock:
+            if self.running: return False
+            self.running = True
+        threading.Thread(target=self._run, args=(trigger,), name='db-backup', daemon=True).start()
+        return True
+
+    def run(self, trigger='manual'):
+        """同步执行一次备份 (调用方需确保没有并发备份)"""
+        with self._lock:
+            if self.running: raise RuntimeError('已有备份正在进行')
+            self.running = True
+        return self._run(trigger)
+
+    def _run(self, trigger):
+        started = time.perf_counter()
+        os.makedirs(Config.BACKUP_DIR, exist_ok=True)
+        name, path, tmp = self._reserve()
+        result = {'file': name, 'trigger': trigger, 'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        try:
+            result['restarts'], result['mode'] = self._copy(tmp)
+            result['integrity'] = verify_backup(tmp)
+            if result['integrity'] != 'ok': raise RuntimeError(f"备份副本校验失败: {result['integrity']}")
+            os.replace(tmp, path)
+            result.update(ok=True, size=os.path.getsize(path), removed=self._rotate())
+        except Exception as e:
+            if os.path.exists(tmp): os.remove(tmp)
+            result.update(ok=False, error=str(e))
+        finally:
+            result['seconds'] = round(time.perf_counter() - started, 2)
+            self.last, self.progress, self.running = result, None, False
+        return result
+
+    def _reserve(self):
+        """文件名精确到毫秒；同一毫秒 (定时备份撞上手动备份，或另一个 worker 进程) 再加序号。
+        用 O_EXCL 先占住临时文件，两次备份不会写到同一个文件；备份含学生数据，只给属主读写"""
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]
+        for n in itertools.count():
+            name = f"{self.PREFIX}{stamp}{f'-{n}' if n else ''}.db"
+            path = os.path.join(Config.BACKUP_DIR, name)
+            if os.path.exists(path): continue
+            try:
+                os.close(os.open(path + '.tmp', os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+            except FileExistsError:
+                continue
+            return name, path, path + '.tmp'
+
+    def _copy(self, tmp):
+        restarts = 0
+        while True:
+            chunked = restarts < self.max_restarts
+            seen = {'remaining': None}
+            def step(status, remaining, total):
+                self.progress = (remaining, total)
+                # 剩余页数变多说明源库被其他连接改过、拷贝已从头开始
+                if seen['remaining'] is not None and remaining > seen['remaining']:
+                    raise BackupRestarted()
+                seen['remaining'] = remaining
+                if chunked and remaining: time.sleep(Config.BACKUP_STEP_SLEEP)
+            src = sqlite3.connect(_readonly_uri(Config.DATABASE_PATH), uri=True)
+            dst = sqlite3.connect(tmp)
+            try:
+                src.backup(dst, pages=Config.BACKUP_PAGES if chunked else -1, progress=step)
+                dst.execute('PRAGMA journal_mode=DELETE')
+                return restarts, 'chunked' if chunked else 'single-step'
+            except BackupRestarted:
+                restarts += 1
+            finally:
+                src.close(); dst.close()
+
+    def _rotate(self):
+        files = self.list()
+        removed = [f['file'] for f in files[Config.BACKUP_KEEP:]]
+        for f in removed: os.remove(os.path.join(Config.BACKUP_DIR, f))
+        return removed
+
+    def list(self):
+        """现有备份，新的在前"""
+        if not os.path.isdir(Config.BACKUP_DIR): return []
+        names = sorted((n for n in os.listdir(Config.BACKUP_DIR) if n.startswith(self.PREFIX) and n.endswith('.db')), reverse=True)
+        return [{'file': n, 'size': os.path.getsize(os.path.join(Config.BACKUP_DIR, n))} for n in names]
+
+    def start_scheduler(self):
+        """按 BACKUP_INTERVAL_HOURS 自动备份：最新一份备份过期就补做一次"""
+        if not Config.BACKUP_INTERVAL_HOURS or self._scheduler: return
+        def loop():
+            while True:
+                files = self.list()
+                newest = os.path.getmtime(os.path.join(Config.BACKUP_DIR, files[0]['file'])) if files else 0
+                if time.time() - newest >= Config.BACKUP_INTERVAL_HOURS * 3600: self.start('scheduled')
+                time.sleep(600)
+        self._scheduler = threading.Thread(target=loop, name='db-backup-scheduler', daemon=True)
+        self._scheduler.start()
+
+def verify_backup(path):
+    """恢复前校验：只读打开副本跑 integrity_check，返回 'ok' 或首条错误"""
+    conn = sqlite3.connect(_readonly_uri(path), uri=True)
+    try:
+        return conn.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        conn.close()
+
+backups = BackupManager()
+
+@app.route('/api/system/backup', methods=['POST'])
+def system_backup():
+    """立即开始一次在线备份 (后台执行，进度见 /api/system/backup/status)"""
+    if not backups.start(): return jsonify({'error': '已有备份正在进行'}), 409
+    return jsonify({'success': True}), 202
+
+@app.route('/api/system/backup/status')
+def backup_status():
+    progress = None
+    if backups.progress:
+        remaining, total = backups.progress
+        progress = {'remaining_pages': remaining, 'total_pages': total}
+    return jsonify({'running': backups.running, 'progress': progress, 'last': backups.last,
+                    'keep': Config.BACKUP_KEEP, 'backups': backups.list()})
+
+@app.route('/api/system/backup/verify', methods=['POST'])
+def backup_verify():
+    """恢复前再次校验指定备份"""
+    name = (request.json or {}).get('file', '')
+    if name not in {f['file'] for f in backups.list()}: return jsonify({'error': '备份不存在'}), 404
+    result = verify_backup(os.path.join(Config.BACKUP_DIR, name))
+    return jsonify({'file': name, 'integrity': result, 'ok': result == 'ok'})
+
+# --- 3.3 余额对账 (增量检查点) ---
+def reset_ledger_checkpoint(conn):
+    """清空流水表之前调用 (学期结转、系统重置)：检查点作废，先删掉它，清空流水时触发器也就不再记差额。
+    下次对账重新全量汇总一次 (此时流水表很小)"""
+    for table in ('ledger_checkpoint', 'ledger_sums', 'ledger_changes'):
+        conn.execute(f'DELETE FROM {table}')
+
+def reconcile_balances(conn, repair=None):
+    """对账：把 ledger_sums 推进到最新 (只扫 last_id 之后的新流水与 ledger_changes)，再与 students.points 逐人比对。
+    没有检查点时全量汇总一次。repair='balance' 把余额改成流水合计，repair='ledger' 补记一条 adjustment 流水
+    让流水合计等于余额。须在写事务内调用。返回对账报告"""
+    started = time.perf_counter()
+    # checked_at 为空表示 Reconciler 正在分步重建，合计还不可用
+    cp = conn.execute('SELECT last_id FROM ledger_checkpoint WHERE checked_at IS NOT NULL').fetchone()
+    top = conn.execute('SELECT COALESCE(MAX(id), 0) FROM points_history').fetchone()[0]
+    if cp is None:
+        reset_ledger_checkpoint(conn)
+        conn.execute('''INSERT INTO ledger_sums (student_id, total)
+                        SELECT student_id, SUM(change_amount) FROM points_history WHERE status = 'approved' GROUP BY student_id''')
+        last, changes = 0, 0
+    else:
+        last = cp[0]
+        changes = conn.execute('SELECT COUNT(*) FROM ledger_changes').fetchone()[0]
+        conn.execute('''
+            INSERT INTO ledger_sums (student_id, total)
+            SELECT student_id, SUM(delta) FROM (
+                -- +status 让规划器走主键区间，不去扫 (status, ...) 索引里全部已生效记录
+                SELECT student_id, change_amount AS delta FROM points_history WHERE id > ? AND +status = 'approved'
+                UNION ALL SELECT student_id, delta FROM ledger_changes)
+            WHERE true GROUP BY student_id
+            ON CONFLICT(student_id) DO UPDATE SET total = total + excluded.total
+        ''', (last,))
+        conn.execute('DELETE FROM ledger_changes')
+    drift = [{'id': r[0], 'name': r[1], 'points': r[2], 'ledger': r[3], 'diff': r[2] - r[3]} for r in conn.execute('''
+        SELECT s.id, s.name, s.points, COALESCE(l.total, 0) FROM students s LEFT JOIN ledger_sums l ON l.student_id = s.id
+        WHERE s.points IS NOT COALESCE(l.total, 0) ORDER BY s.id''')]
+
+    if drift and repair == 'balance':
+        apply_balance_deltas(conn, [(d['id'], -d['diff']) for d in drift])
+    elif drift and repair == 'ledger':
+        entries = [(d['id'], d['diff'], '对账补记: 余额与流水差额') for d in drift]
+        last_row = conn.execute(LEDGER_INSERT, ('系统', 'approved', 'adjustment', None, json.dumps(entries))).lastrowid
+        # 补记的流水直接计入合计，检查点越过它们
+        conn.executemany('''INSERT INTO ledger_sums (student_id, total) VALUES (?, ?)
+                            ON CONFLICT(student_id) DO UPDATE SET total = total + excluded.total''', [(d['id'], d['diff']) for d in drift])
+        top = last_row
+    checked_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute('INSERT OR REPLACE INTO ledger_checkpoint (id, last_id, checked_at) VALUES (1, ?, ?)', (top, checked_at))
+    return {'checked_at': checked_at, 'full': cp is None, 'last_id': top, 'new_rows': top - last, 'changed_rows': changes,
+            'drift': drift, 'repair': repair if drift else None, 'ms': round((time.perf_counter() - started) * 1000, 1)}
+
+class Reconciler:
+    """对账入口：独立连接上开 BEGIN IMMEDIATE 执行，与各进程的写入按 SQLite 写锁串行；
+    预派生模式下父进程的定时对账也不会碰连接池 (子进程由父进程 fork 出来)。
+    需要全量汇总时 (首次对账、结转之后) 先在读事务里算好合计，写锁只在写入结果时短暂持有，
+    百万级流水也不会让写线程等锁超时"""
+    REPAIRS = ('balance', 'ledger')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.last = None  # 最近一次对账报告
+        self._scheduler = None
+
+    def _connect(self):
+        conn = sqlite3.connect(Config.DATABASE_PATH, timeout=Config.DB_BUSY_TIMEOUT_MS / 1000)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA busy_timeout={int(Config.DB_BUSY_TIMEOUT_MS)}')
+        return conn
+
+    def run(self, repair=None):
+        if repair not in (None,) + self.REPAIRS: raise ValueError(f'未知的修复方式: {repair}')
+        with self._lock:
+            conn = self._connect()
+            try:
+                valid = conn.execute('SELECT 1 FROM ledger_checkpoint WHERE checked_at IS NOT NULL').fetchone()
+                rebuilt = None if valid else self._rebuild(conn)
+                conn.execute('BEGIN IMMEDIATE')
+                report = reconcile_balances(conn, repair)
+                conn.commit()
+            finally:
+                conn.close()
+            if rebuilt is not None: report.update(full=True, ms=round(report['ms'] + rebuilt, 1))
+            self.last = report
+        if report['repair']: bump_points_generation()
+        return report
+
+    def _rebuild(self, conn):
+        """分三步全量汇总，返回耗时 (ms)；检查点已被别处重建好时返回 None。
+        1. 写事务：检查点设为“重建中” (checked_at 为空)，此后对旧流水的改动由触发器记进 ledger_changes；
+        2. 读事务：在 WAL 快照上汇总 id <= last_id 的已生效流水，并记下快照里 ledger_changes 的最大 id (这些改动已算进合计)；
+        3. 写事务：写入合计、删掉已算进去的改动并标记检查点可用。其余改动与新流水随后由增量对账补上"""
+        started = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        reset_ledger_checkpoint(conn)
+        top = conn.execute('SELECT COALESCE(MAX(id), 0) FROM points_history').fetchone()[0]
+        conn.execute('INSERT INTO ledger_checkpoint (id, last_id, checked_at) VALUES (1, ?, NULL)', (top,))
+        conn.commit()
+
+        conn.execute('BEGIN')
+        sums = conn.execute("""SELECT student_id, SUM(change_amount) FROM points_history
+                               WHERE status = 'approved' AND id <= ? GROUP BY student_id""", (top,)).fetchall()
+        seen = conn.execute('SELECT COALESCE(MAX(id), 0) FROM ledger_changes').fetchone()[0]
+        conn.commit()
+
+        conn.execute('BEGIN IMMEDIATE')
+        cp = conn.execute('SELECT last_id FROM ledger_checkpoint WHERE checked_at IS NULL').fetchone()
+        if cp is None or cp[0] != top:
+            conn.rollback()  # 另一个进程的对账已经接手
+            return None
+        conn.execute('DELETE FROM ledger_sums')
+        conn.executemany('INSERT INTO ledger_sums (student_id, total) VALUES (?, ?)', [tuple(r) for r in sums])
+        conn.execute('DELETE FROM ledger_changes WHERE id <= ?', (seen,))
+        conn.execute('UPDATE ledger_checkpoint SET checked_at = ?', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+        conn.commit()
+        return (time.perf_counter() - started) * 1000
+
+    def checked_at(self):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT checked_at FROM ledger_checkpoint').fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def start_scheduler(self):
+        """按 RECONCILE_INTERVAL_HOURS 自动对账 (只报告)：上次对账时间存在库里，重启后不会重复跑"""
+        if not Config.RECONCILE_INTERVAL_HOURS or self._scheduler: return
+        def loop():
+            while True:
+                try:
+                    checked = self.checked_at()
+                    age = (datetime.now() - datetime.strptime(checked, '%Y-%m-%d %H:%M:%S')).total_seconds() if checked else None
+                    if age is None or age >= Config.RECONCILE_INTERVAL_HOURS * 3600:
+                        report = self.run()
+                        if report['drift']: print(f"⚠️ 对账发现 {len(report['drift'])} 名学生余额与流水不一致")
+                except Exception as e:
+                    print(f'自动对账失败: {e}')
+                time.sleep(600)
+        self._scheduler = threading.Thread(target=loop, name='ledger-reconcile-scheduler', daemon=True)
+        self._scheduler.start()
+
+reconciler = Reconciler()
+
+@app.route('/api/system/reconcile', methods=['GET', 'POST'])
+def system_reconcile():
+    """GET 返回最近一次对账报告；POST 立即对账，{repair: null | 'balance' | 'ledger'} 可选修复"""
+    if request.method == 'GET': return jsonify({'last': reconciler.last, 'checked_at': reconciler.checked_at()})
+    try:
+        return jsonify(reconciler.run((request.json or {}).get('repair') or None))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # --- 4. 核心业务接口 (单班级简化版) ---
 
 @app.route('/api/system/info')
+@conditional('system')
 def get_system_info():
     conn = get_db_connection()
     info = conn.execute('SELECT * FROM system_config LIMIT 1').fetchone()
@@ -152,11 +1491,11 @@ def get_system_info():
 @app.route('/api/system/setup', methods=['POST'])
 def system_setup():
     data = request.json
-    conn = get_db_connection()
-    conn.execute('INSERT OR REPLACE INTO system_config (id, class_name, teacher_name) VALUES (1, ?, ?)', (data['class_name'], data.get('teacher_name', '')))
-    conn.execute('INSERT OR REPLACE INTO classes (id, name, teacher) VALUES (1, ?, ?)', (data['class_name'], data.get('teacher_name', '')))
-    conn.commit()
-    conn.close()
+    def write(conn):
+        conn.execute('INSERT OR REPLACE INTO system_config (id, class_name, teacher_name) VALUES (1, ?, ?)', (data['class_name'], data.get('teacher_name', '')))
+        conn.execute('INSERT OR REPLACE INTO classes (id, name, teacher) VALUES (1, ?, ?)', (data['class_name'], data.get('teacher_name', '')))
+    writer.run(write)
+    generations.bump('system')
     return jsonify({'success': True})
 
 @app.route('/api/classes', methods=['GET'])
@@ -171,16 +1510,32 @@ def get_classes():
         return jsonify([])
 
 @app.route('/api/students', methods=['GET', 'POST'])
+@conditional('points')
 def handle_students():
-    conn = get_db_connection()
     if request.method == 'POST':
         data = request.json
-        conn.execute('INSERT INTO students (class_id, name, student_id, group_id) VALUES (1, ?, ?, ?)', (data['name'], data['student_id'], data.get('group_id')))
-        conn.commit()
+        writer.execute('INSERT INTO students (class_id, name, student_id, group_id) VALUES (1, ?, ?, ?)', (data['name'], data['student_id'], data.get('group_id')))
+        bump_points_generation()
         return jsonify({'success': True})
-    rows = conn.execute('SELECT s.*, g.name as group_name FROM students s LEFT JOIN groups g ON s.group_id = g.id ORDER BY s.name').fetchall()
+    conn = get_db_connection()
+    try:
+        limit, after = page_request((str, int))
+    except ValueError as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 400
+    if limit is None:
+        rows = conn.execute('SELECT s.*, g.name as group_name FROM students s LEFT JOIN groups g ON s.group_id = g.id ORDER BY s.name, s.id').fetchall()
+        conn.close()
+        return jsonify(rows)
+    # 分页：按 (name, id) 键集翻页
+    rows = conn.execute(f'''
+        SELECT s.*, g.name as group_name FROM students s LEFT JOIN groups g ON s.group_id = g.id
+        {'WHERE (s.name, s.id) > (?, ?)' if after else ''}
+        ORDER BY s.name, s.id LIMIT ?
+    ''', (after or []) + [limit + 1]).fetchall()
     conn.close()
-    return jsonify([dict(r) for r in rows])
+    items, next_cursor = page_result(rows, limit, lambda r: (r['name'], r['id']))
+    return jsonify({'items': items, 'next_cursor': next_cursor})
 
 @app.route('/api/students/<int:sid>/quick_points', methods=['POST'])
 def quick_points(sid):
@@ -189,13 +1544,10 @@ def quick_points(sid):
         data = request.json
         change = int(data.get('change_amount', 1))
         reason = data.get('reason', '[互动管理/随机点名] 幸运抽中加分')
-        conn = get_db_connection()
-        conn.execute('UPDATE students SET points = points + ? WHERE id = ?', (change, sid))
-        conn.execute('INSERT INTO points_history (student_id, change_amount, reason, teacher, status) VALUES (?, ?, ?, ?, "approved")',
-                     (sid, change, reason, data.get('teacher', '系统')))
-        conn.commit()
-        conn.close()
+        writer.run(post_ledger, [(sid, change, reason)], data.get('teacher', '系统'), 'quick')
+        bump_points_generation()
         return jsonify({'success': True})
+    except WriteBusy: raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -206,41 +1558,40 @@ def group_quick_points(gid):
         data = request.json
         change = int(data.get('change_amount', 1))
         reason = data.get('reason', '[互动管理/随机点名] 小组幸运抽中')
-        conn = get_db_connection()
-        # 1. 找到所有组员
-        members = conn.execute('SELECT id FROM students WHERE group_id = ?', (gid,)).fetchall()
-        for m in members:
-            conn.execute('UPDATE students SET points = points + ? WHERE id = ?', (change, m['id']))
-            conn.execute('INSERT INTO points_history (student_id, change_amount, reason, teacher, status) VALUES (?, ?, ?, ?, "approved")',
-                         (m['id'], change, reason, data.get('teacher', '系统')))
-        conn.commit()
-        conn.close()
+        def write(conn):
+            members = conn.execute('SELECT id FROM students WHERE group_id = ?', (gid,)).fetchall()
+            post_ledger(conn, [(m['id'], change, reason) for m in members], data.get('teacher', '系统'), 'quick')
+            return members
+        members = writer.run(write)
+        bump_points_generation()
         return jsonify({'success': True, 'count': len(members)})
+    except WriteBusy: raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/groups', methods=['GET', 'POST'])
+@conditional('points')
 def handle_groups():
-    conn = get_db_connection()
     if request.method == 'POST':
         data = request.json
-        conn.execute('INSERT INTO groups (class_id, name, color) VALUES (1, ?, ?)', (data['name'], data.get('color', '#667eea')))
-        conn.commit()
+        writer.execute('INSERT INTO groups (class_id, name, color) VALUES (1, ?, ?)', (data['name'], data.get('color', '#667eea')))
+        bump_points_generation()
         return jsonify({'success': True})
+    conn = get_db_connection()
     rows = conn.execute('SELECT g.*, COUNT(s.id) as student_count, AVG(s.points) as avg_points FROM groups g LEFT JOIN students s ON g.id = s.group_id GROUP BY g.id').fetchall()
     conn.close()
-    return jsonify([dict(r) for r in rows])
+    return jsonify(rows)
 
 @app.route('/api/point_standards', methods=['GET', 'POST'])
+@conditional('standards')
 def handle_standards():
-    conn = get_db_connection()
     if request.method == 'POST':
         data = request.json
-        conn.execute('INSERT INTO point_standards (area, category, name, default_points) VALUES (?, ?, ?, ?)', 
-                     (data['area'], data['category'], data['name'], data['points']))
-        conn.commit()
-        conn.close()
+        writer.execute('INSERT INTO point_standards (area, category, name, default_points) VALUES (?, ?, ?, ?)', 
+                       (data['area'], data['category'], data['name'], data['points']))
+        generations.bump('standards')
         return jsonify({'success': True})
+    conn = get_db_connection()
     
     # GET 支持按 Area 模糊匹配
     area = request.args.get('area')
@@ -249,81 +1600,80 @@ def handle_standards():
     else:
         rows = conn.execute('SELECT * FROM point_standards ORDER BY area, category').fetchall()
     conn.close()
-    return jsonify([dict(r) for r in rows])
+    return jsonify(rows)
 
 @app.route('/api/point_standards/<int:sid>', methods=['PUT', 'DELETE'])
 def update_delete_standard(sid):
-    conn = get_db_connection()
     if request.method == 'DELETE':
-        conn.execute('DELETE FROM point_standards WHERE id = ?', (sid,))
-        conn.commit()
-        conn.close()
+        writer.execute('DELETE FROM point_standards WHERE id = ?', (sid,))
+        generations.bump('standards')
         return jsonify({'success': True})
     
     data = request.json
-    conn.execute('UPDATE point_standards SET area=?, category=?, name=?, default_points=? WHERE id=?',
-                 (data['area'], data['category'], data['name'], data['points'], sid))
-    conn.commit()
-    conn.close()
+    writer.execute('UPDATE point_standards SET area=?, category=?, name=?, default_points=? WHERE id=?',
+                   (data['area'], data['category'], data['name'], data['points'], sid))
+    generations.bump('standards')
     return jsonify({'success': True})
 
 @app.route('/api/point_standards/batch_update_category', methods=['POST'])
 def batch_update_std_category():
     data = request.json
-    conn = get_db_connection()
-    conn.execute('UPDATE point_standards SET category = ? WHERE category = ? AND area = ?',
-                 (data['new_category'], data['old_category'], data['area']))
-    conn.commit()
-    conn.close()
+    writer.execute('UPDATE point_standards SET category = ? WHERE category = ? AND area = ?',
+                   (data['new_category'], data['old_category'], data['area']))
+    generations.bump('standards')
     return jsonify({'success': True})
 
+def default_point_standards():
+    """系统默认的积分理由库 (学科扣分 + 荣誉加分)，返回 (area, category, name, points) 列表"""
+    subjects = ['语文', '数学', '英语', '物理', '化学', '生物', '政治', '历史', '地理']
+    standards = []
+
+    # 1. 学业管理 (学科扣分)
+    for sub in subjects:
+        standards.append(('学业管理', sub, '作业缺交/抄袭/敷衍', -10))
+        standards.append(('学业管理', sub, '随堂测验/单元考不及格', -10))
+        standards.append(('学业管理', sub, '课堂违纪(手机/睡觉/闲聊)', -5))
+        standards.append(('学业管理', sub, '笔记缺失/书本未带', -2))
+
+    # 2. 班级管理 (纪律扣分)
+    attend_cats = ['早自习', '午休纪律', '晚自习', '课堂考勤', '集体活动']
+    for cat in attend_cats:
+        standards.append(('班级管理', cat, '迟到/早退', -5))
+        standards.append(('班级管理', cat, '旷课/擅自脱岗', -20))
+        standards.append(('班级管理', cat, '大声喧哗/打闹违纪', -10))
+
+    # 3. 活动管理 (奖励项)
+    act_cats = ['校级竞赛', '体育运动', '艺术文化', '社会实践']
+    for cat in act_cats:
+        standards.append(('活动管理', cat, '代表班级参赛(基础奖)', 5))
+        standards.append(('活动管理', cat, '获得校级名次/奖项', 15))
+        standards.append(('活动管理', cat, '市级及以上重大荣誉', 50))
+
+    # 4. 自定义 (原德育/其他加分项)
+    plus_cats = ['品德楷模', '班级勤务', '同伴互助']
+    for cat in plus_cats:
+        standards.append(('自定义', cat, '拾金不昧/见义勇为', 20))
+        standards.append(('自定义', cat, '主动承担额外扫除', 5))
+        standards.append(('自定义', cat, '辅导同学学业(获认可)', 10))
+        
+    # 5. 自定义 (负分项)
+    standards.append(('自定义', '行为规范', '损坏公物/破坏环境', -10))
+    standards.append(('自定义', '行为规范', '浪费粮食/水电', -5))
+    standards.append(('自定义', '行为规范', '仪容仪表不整', -2))
+    return standards
+
+def replace_point_standards(conn, standards):
+    conn.execute('DELETE FROM point_standards')
+    conn.executemany('INSERT INTO point_standards (area, category, name, default_points) VALUES (?, ?, ?, ?)', standards)
+
 @app.route('/api/point_standards/reset', methods=['POST'])
 def reset_standards():
     """重置积分理由库为最新设计的逻辑 (学科扣分 + 荣誉加分)"""
     try:
-        conn = get_db_connection()
-        conn.execute('DELETE FROM point_standards')
-        
-        subjects = ['语文', '数学', '英语', '物理', '化学', '生物', '政治', '历史', '地理']
-        standards = []
-
-        # 1. 学业管理 (学科扣分)
-        for sub in subjects:
-            standards.append(('学业管理', sub, '作业缺交/抄袭/敷衍', -10))
-            standards.append(('学业管理', sub, '随堂测验/单元考不及格', -10))
-            standards.append(('学业管理', sub, '课堂违纪(手机/睡觉/闲聊)', -5))
-            standards.append(('学业管理', sub, '笔记缺失/书本未带', -2))
-
-        # 2. 班级管理 (纪律扣分)
-        attend_cats = ['早自习', '午休纪律', '晚自习', '课堂考勤', '集体活动']
-        for cat in attend_cats:
-            standards.append(('班级管理', cat, '迟到/早退', -5))
-            standards.append(('班级管理', cat, '旷课/擅自脱岗', -20))
-            standards.append(('班级管理', cat, '大声喧哗/打闹违纪', -10))
-
-        # 3. 活动管理 (奖励项)
-        act_cats = ['校级竞赛', '体育运动', '艺术文化', '社会实践']
-        for cat in act_cats:
-            standards.append(('活动管理', cat, '代表班级参赛(基础奖)', 5))
-            standards.append(('活动管理', cat, '获得校级名次/奖项', 15))
-            standards.append(('活动管理', cat, '市级及以上重大荣誉', 50))
-
-        # 4. 自定义 (原德育/其他加分项)
-        plus_cats = ['品德楷模', '班级勤务', '同伴互助']
-        for cat in plus_cats:
-            standards.append(('自定义', cat, '拾金不昧/见义勇为', 20))
-            standards.append(('自定义', cat, '主动承担额外扫除', 5))
-            standards.append(('自定义', cat, '辅导同学学业(获认可)', 10))
-            
-        # 5. 自定义 (负分项)
-        standards.append(('自定义', '行为规范', '损坏公物/破坏环境', -10))
-        standards.append(('自定义', '行为规范', '浪费粮食/水电', -5))
-        standards.append(('自定义', '行为规范', '仪容仪表不整', -2))
-
-        conn.executemany('INSERT INTO point_standards (area, category, name, default_points) VALUES (?, ?, ?, ?)', standards)
-        conn.commit()
-        conn.close()
+        writer.run(replace_point_standards, default_point_standards())
+        generations.bump('standards')
         return jsonify({'success': True})
+    except WriteBusy: raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -335,6 +1685,7 @@ def export_standards():
         rows = conn.execute('SELECT area, category, name, default_points FROM point_standards ORDER BY area, category').fetchall()
         conn.close()
 
+        from openpyxl import Workbook
         wb = Workbook()
         ws = wb.active
         ws.title = "积分评分标准"
@@ -350,6 +1701,59 @@ def export_standards():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+HISTORY_STATUS_LABELS = {'approved': '已生效', 'pending': '待审核', 'rejected': '已驳回'}
+
+@app.route('/api/points_history/export', methods=['GET'])
+def export_points_history():
+    """导出积分明细账 (支持 start_date/end_date/student_id/status 筛选)
+    分批读取 + openpyxl 只写模式 + 溢出到磁盘的临时文件，百万行导出内存占用也保持恒定"""
+    try:
+        where, params = [], []
+        if request.args.get('start_date'):
+            where.append('ph.created_date >= ?'); params.append(request.args['start_date'])
+        if request.args.get('end_date'):
+            where.append('ph.created_date <= ?'); params.append(request.args['end_date'])
+        if request.args.get('student_id'):
+            sid = request.args.get('student_id', type=int)
+            if sid is None: return jsonify({'error': 'student_id 参数错误'}), 400
+            where.append('ph.student_id = ?'); params.append(sid)
+        if request.args.get('status'):
+            where.append('ph.status = ?'); params.append(request.args['status'])
+        where_sql = ('WHERE ' + ' AND '.join(where)) if where else ''
+
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("积分明细")
+        ws.append(["记录ID", "时间", "学号", "姓名", "分组", "变动", "理由", "操作人", "状态"])
+
+        conn = get_db_connection()
+        cur = conn.execute(f'''
+            SELECT ph.id, ph.created_at, s.student_id as student_no, s.name, g.name as group_name,
+                   ph.change_amount, ph.reason, ph.teacher, ph.status
+            FROM points_history ph
+            LEFT JOIN students s ON ph.student_id = s.id
+            LEFT JOIN groups g ON s.group_id = g.id
+            {where_sql}
+            ORDER BY ph.id
+        ''', params)
+        while True:
+            rows = cur.fetchmany(5000)
+            if not rows: break
+            for r in rows:
+                ws.append([r['id'], r['created_at'], r['student_no'], r['name'], r['group_name'],
+                           r['change_amount'], r['reason'], r['teacher'], HISTORY_STATUS_LABELS.get(r['status'], r['status'])])
+        conn.close()
+
+        # 小文件留在内存，超过 8MB 自动落盘；响应按块读出后关闭
+        output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        wb.save(output)
+        output.seek(0)
+        name = f"积分明细_{datetime.now().strftime('%Y%m%d')}.xlsx"
+        return send_file(output, as_attachment=True, download_name=name,
+                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/point_standards/import', methods=['POST'])
 def import_standards():
     """从 Excel 导入积分理由库"""
@@ -361,6 +1765,7 @@ def import_standards():
         return jsonify({'error': '无效文件'}), 400
 
     try:
+        from openpyxl import load_workbook
         wb = load_workbook(file)
         ws = wb.active
         
@@ -373,21 +1778,19 @@ def import_standards():
         if not standards:
             return jsonify({'error': '文件中没有有效数据'}), 400
 
-        conn = get_db_connection()
         # 导入通常是增量还是覆盖？这里采用覆盖逻辑，保持与 reset 一致
-        conn.execute('DELETE FROM point_standards')
-        conn.executemany('INSERT INTO point_standards (area, category, name, default_points) VALUES (?, ?, ?, ?)', standards)
-        conn.commit()
-        conn.close()
+        writer.run(replace_point_standards, standards)
+        generations.bump('standards')
         
         return jsonify({'success': True, 'count': len(standards)})
+    except WriteBusy: raise
     except Exception as e:
         return jsonify({'error': f"解析文件失败: {str(e)}"}), 500
 
 @app.route('/api/rewards', methods=['GET', 'POST'])
+@conditional('rewards')
 def handle_rewards():
     """奖品管理：获取、添加 (支持图片上传)"""
-    conn = get_db_connection()
     if request.method == 'POST':
         # 兼容 JSON 和 Form-Data
         if request.is_json:
@@ -406,34 +1809,46 @@ def handle_rewards():
                 file = request.files['image']
                 if file and file.filename:
                     fname = secure_filename(f"{int(time.time())}_{file.filename}")
+                    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
                     file.save(os.path.join(app.config['UPLOAD_FOLDER'], fname))
                     img_path = f"/static/uploads/{fname}"
 
-        conn.execute('INSERT INTO rewards (name, description, points_cost, stock, is_grocery, is_special, image_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-                     (name, desc, int(pts), int(stock), int(is_g), int(is_s), img_path, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-        conn.commit()
-        conn.close()
+        writer.execute('INSERT INTO rewards (name, description, points_cost, stock, is_grocery, is_special, image_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                       (name, desc, int(pts), int(stock), int(is_g), int(is_s), img_path, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        generations.bump('rewards')
         return jsonify({'success': True})
     
-    # GET: 支持小铺筛选
+    # GET: 支持小铺筛选，可选 (created_at, id) 倒序游标分页
+    conn = get_db_connection()
+    try:
+        limit, after = page_request((str, int))
+    except ValueError as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 400
+    where, params = [], []
     is_grocery = request.args.get('is_grocery')
     if is_grocery is not None:
         try:
             is_grocery = int(is_grocery)
         except:
             is_grocery = 0
-        rows = conn.execute('SELECT * FROM rewards WHERE is_grocery = ? ORDER BY created_at DESC', (is_grocery,)).fetchall()
-    else:
-        rows = conn.execute('SELECT * FROM rewards ORDER BY created_at DESC').fetchall()
+        where.append('is_grocery = ?'); params.append(is_grocery)
+    if after:
+        where.append('(created_at, id) < (?, ?)'); params += after
+    where_sql = ('WHERE ' + ' AND '.join(where)) if where else ''
+    if limit is None:
+        rows = conn.execute(f'SELECT * FROM rewards {where_sql} ORDER BY created_at DESC, id DESC', params).fetchall()
+        conn.close()
+        return jsonify(rows)
+    rows = conn.execute(f'SELECT * FROM rewards {where_sql} ORDER BY created_at DESC, id DESC LIMIT ?', params + [limit + 1]).fetchall()
     conn.close()
-    return jsonify([dict(r) for r in rows])
+    items, next_cursor = page_result(rows, limit, lambda r: (r['created_at'], r['id']))
+    return jsonify({'items': items, 'next_cursor': next_cursor})
 
 @app.route('/api/rewards/<int:rid>', methods=['DELETE'])
 def delete_reward(rid):
-    conn = get_db_connection()
-    conn.execute('DELETE FROM rewards WHERE id = ?', (rid,))
-    conn.commit()
-    conn.close()
+    writer.execute('DELETE FROM rewards WHERE id = ?', (rid,))
+    generations.bump('rewards')
     return jsonify({'success': True})
 
 @app.route('/api/classes/<int:class_id>/stats', methods=['GET'])
@@ -450,14 +1865,11 @@ def get_class_stats(class_id):
             date_str = datetime.now().strftime('%Y-%m-%d')
         
         # 2. 获取加分记录 (荣誉榜)
-        all_plus = conn.execute('''
+        all_plus = conn.execute(f'''
             SELECT ph.*, s.name as student_name 
             FROM points_history ph JOIN students s ON ph.student_id = s.id 
-            WHERE ph.status = 'approved' AND ph.change_amount > 0 AND date(ph.created_at) = ?
-            AND ph.reason NOT LIKE '%兑换%' 
-            AND ph.reason NOT LIKE '%拍卖%' 
-            AND ph.reason NOT LIKE '%悬赏%'
-            AND ph.reason NOT LIKE '%结项%'
+            WHERE ph.created_date = ? AND ph.status = 'approved' AND ph.change_amount > 0
+            AND ph.kind NOT IN {NON_EARNING_SQL}
             ORDER BY ph.created_at DESC
         ''', (date_str,)).fetchall()
         
@@ -467,7 +1879,7 @@ def get_class_stats(class_id):
         
         for p in all_plus:
             p_dict = dict(p)
-            if p_dict['reason'].startswith('[基本准则]'):
+            if p_dict['kind'] == 'benchmark_bonus':
                 key = (p_dict['reason'], p_dict['created_at'])
                 if key not in benchmark_groups:
                     benchmark_groups[key] = {
@@ -490,14 +1902,11 @@ def get_class_stats(class_id):
         plus_list.sort(key=lambda x: x['created_at'], reverse=True)
 
         # 3. 获取减分记录 (违纪榜 - 保持明细展示)
-        minus = conn.execute('''
+        minus = conn.execute(f'''
             SELECT ph.*, s.name as student_name 
             FROM points_history ph JOIN students s ON ph.student_id = s.id 
-            WHERE ph.status = 'approved' AND ph.change_amount < 0 AND date(ph.created_at) = ?
-            AND ph.reason NOT LIKE '%兑换%' 
-            AND ph.reason NOT LIKE '%拍卖%' 
-            AND ph.reason NOT LIKE '%悬赏%'
-            AND ph.reason NOT LIKE '%结项%'
+            WHERE ph.created_date = ? AND ph.status = 'approved' AND ph.change_amount < 0
+            AND ph.kind NOT IN {NON_EARNING_SQL}
             ORDER BY ph.created_at DESC
         ''', (date_str,)).fetchall()
         
@@ -511,7 +1920,7 @@ def get_class_stats(class_id):
             'max_points': res_stats['max'] or 0,
             'min_points': res_stats['min'] or 0,
             'plus_changes': plus_list,
-            'minus_changes': [dict(r) for r in minus]
+            'minus_changes': minus
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -521,29 +1930,48 @@ def get_system_stats():
     return get_class_stats(1)
 
 @app.route('/api/ranking', methods=['GET'])
+@conditional('points')
 def get_ranking_api():
     """获取单班级排行榜 (优化版 SQL)"""
     try:
-        rtype = request.args.get('type', 'student')
+        rtype = 'student' if request.args.get('type', 'student') == 'student' else 'group'
         start = request.args.get('start_date')
         end = request.args.get('end_date')
+        try:
+            for d in (start, end):
+                if d: datetime.strptime(d, '%Y-%m-%d')
+        except ValueError:
+            return jsonify({'error': '日期格式应为 YYYY-MM-DD'}), 400
+        if not (start and end): start = end = None
+
+        # 缓存命中：自上次查询以来没有积分写入，直接返回上次的结果
+        key = (rtype, start, end)
+        gen = generations.get('points')
+        cached = _ranking_cache.get(key, gen)
+        if cached is not None:
+            return app.response_class(cached, mimetype='application/json')
         
         conn = get_db_connection()
+        # 日期区间先在 points_history 上走 created_date 索引聚合，再与名单关联
         date_filter = ""
         params = []
         if start and end:
-            date_filter = " AND date(ph.created_at) BETWEEN ? AND ?"
+            date_filter = '''
+                SELECT student_id, SUM(change_amount) as points FROM points_history
+                WHERE created_date BETWEEN ? AND ? AND status = 'approved'
+                GROUP BY student_id
+            '''
             params = [start, end]
 
         if rtype == 'student':
             if date_filter:
                 sql = f'''
                     SELECT s.id, s.name, s.student_id, g.name as group_name,
-                           COALESCE(SUM(ph.change_amount), 0) as points
+                           COALESCE(d.points, 0) as points
                     FROM students s
                     LEFT JOIN groups g ON s.group_id = g.id
-                    LEFT JOIN points_history ph ON s.id = ph.student_id AND ph.status = 'approved' {date_filter}
-                    GROUP BY s.id ORDER BY points DESC, s.name ASC
+                    LEFT JOIN ({date_filter}) d ON s.id = d.student_id
+                    ORDER BY points DESC, s.name ASC
                 '''
             else:
                 sql = '''
@@ -556,10 +1984,10 @@ def get_ranking_api():
             if date_filter:
                 sql = f'''
                     SELECT g.id, g.name, g.color,
-                           COALESCE(SUM(ph.change_amount), 0) as points
+                           COALESCE(SUM(d.points), 0) as points
                     FROM groups g
                     LEFT JOIN students s ON g.id = s.group_id
-                    LEFT JOIN points_history ph ON s.id = ph.student_id AND ph.status = 'approved' {date_filter}
+                    LEFT JOIN ({date_filter}) d ON s.id = d.student_id
                     GROUP BY g.id ORDER BY points DESC, g.name ASC
                 '''
             else:
@@ -572,7 +2000,9 @@ def get_ranking_api():
         
         rows = conn.execute(sql, params).fetchall()
         conn.close()
-        return jsonify([dict(r) for r in rows])
+        body = app.json.dumps(rows)
+        _ranking_cache.put(key, gen, body)
+        return app.response_class(body, mimetype='application/json')
     except Exception as e:
         import traceback
         traceback.print_exc() # 打印报错到黑窗口
@@ -583,13 +2013,13 @@ def get_ranking_api():
 @app.route('/api/auction/start', methods=['POST'])
 def start_auction():
     data = request.json
-    conn = get_db_connection()
-    # 取消旧拍卖，开启新拍卖
-    conn.execute('UPDATE auctions SET status = "cancelled" WHERE status = "active"')
-    conn.execute('INSERT INTO auctions (reward_id, class_id, current_price, status) VALUES (?, 1, ?, "active")',
-                 (data['reward_id'], data.get('start_price', 0)))
-    conn.commit()
-    conn.close()
+    def write(conn):
+        # 取消旧拍卖，开启新拍卖
+        conn.execute('UPDATE auctions SET status = "cancelled" WHERE status = "active"')
+        return conn.execute('INSERT INTO auctions (reward_id, class_id, current_price, status) VALUES (?, 1, ?, "active")',
+                            (data['reward_id'], data.get('start_price', 0))).lastrowid
+    auction_id = writer.run(write)
+    broker.publish('auction', {'type': 'started', 'auction_id': auction_id, 'current_price': data.get('start_price', 0)})
     return jsonify({'success': True})
 
 @app.route('/api/auction/current', methods=['GET'])
@@ -612,36 +2042,65 @@ def get_current_auction():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def submit_bid(conn, auction_id, student_id, amount):
+    """原子竞价 (写任务)：一条条件 UPDATE 同时校验拍卖状态、出价高于当前价、积分足够，
+    出价在写线程里串行执行，不会出现低价覆盖高价。返回 (是否成功, 当前价, 领先者, 错误信息)"""
+    row = conn.execute('''
+        UPDATE auctions SET current_price = :amount, highest_bidder_id = :sid
+        WHERE id = :aid AND status = 'active' AND current_price < :amount
+          AND :amount <= (SELECT points FROM students WHERE id = :sid)
+        RETURNING current_price, highest_bidder_id
+    ''', {'aid': auction_id, 'sid': student_id, 'amount': amount}).fetchone()
+    conn.execute('INSERT INTO bids (auction_id, student_id, amount, accepted) VALUES (?, ?, ?, ?)',
+                 (auction_id, student_id, amount, 1 if row else 0))
+    if row:
+        return True, row['current_price'], row['highest_bidder_id'], None
+
+    # 未命中：同一事务内读出拒绝原因与最新价格
+    auc = conn.execute('SELECT status, current_price, highest_bidder_id FROM auctions WHERE id = ?', (auction_id,)).fetchone()
+    stu = conn.execute('SELECT points FROM students WHERE id = ?', (student_id,)).fetchone()
+    if not auc or auc['status'] != 'active':
+        return False, auc['current_price'] if auc else None, auc['highest_bidder_id'] if auc else None, '竞价已失效'
+    if not stu or stu['points'] < amount:
+        return False, auc['current_price'], auc['highest_bidder_id'], '积分不足'
+    return False, auc['current_price'], auc['highest_bidder_id'], '出价过低'
+
 @app.route('/api/auction/bid', methods=['POST'])
 def place_bid():
     data = request.json
+    try:
+        aid, sid, amount = int(data['auction_id']), int(data['student_id']), int(data['amount'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': '参数错误'}), 400
+    ok, price, leader, error = writer.run(submit_bid, aid, sid, amount)
+    if not ok:
+        return jsonify({'error': error, 'current_price': price, 'highest_bidder_id': leader}), 400
     conn = get_db_connection()
-    auc = conn.execute('SELECT * FROM auctions WHERE id = ? AND status = "active"', (data['auction_id'],)).fetchone()
-    if not auc or data['amount'] <= auc['current_price']:
-        return jsonify({'error': '竞价已失效或出价过低'}), 400
-    
-    conn.execute('UPDATE auctions SET current_price = ?, highest_bidder_id = ? WHERE id = ?',
-                 (data['amount'], data['student_id'], data['auction_id']))
-    conn.commit()
+    bidder = conn.execute('SELECT name FROM students WHERE id = ?', (sid,)).fetchone()
     conn.close()
-    return jsonify({'success': True})
+    broker.publish('auction', {'type': 'bid', 'auction_id': aid, 'current_price': price,
+                               'highest_bidder_id': leader, 'bidder_name': bidder['name'] if bidder else None})
+    return jsonify({'success': True, 'current_price': price, 'highest_bidder_id': leader})
 
 @app.route('/api/auction/finish', methods=['POST'])
 def finish_auction():
     data = request.json
-    conn = get_db_connection()
-    auc = conn.execute('SELECT a.*, r.name as rname FROM auctions a JOIN rewards r ON a.reward_id = r.id WHERE a.id = ?', (data['auction_id'],)).fetchone()
-    if auc and auc['highest_bidder_id']:
-        # 扣除积分
-        conn.execute('UPDATE students SET points = points - ? WHERE id = ?', (auc['current_price'], auc['highest_bidder_id']))
-        # 记录历史
-        conn.execute('INSERT INTO points_history (student_id, change_amount, reason, teacher) VALUES (?, ?, ?, "拍卖系统")',
-                     (auc['highest_bidder_id'], -auc['current_price'], f"拍卖得标: {auc['rname']}"))
-    
-    conn.execute('UPDATE auctions SET status = "finished", finished_at = ? WHERE id = ?',
-                 (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), data['auction_id']))
-    conn.commit()
-    conn.close()
+    def write(conn):
+        auc = conn.execute('SELECT a.*, r.name as rname FROM auctions a JOIN rewards r ON a.reward_id = r.id WHERE a.id = ?', (data['auction_id'],)).fetchone()
+        hid = None
+        if auc and auc['highest_bidder_id']:
+            # 扣除积分并记录历史 (直接生效，不进审核队列)
+            (hid,), _ = post_ledger(conn, [(auc['highest_bidder_id'], -auc['current_price'], f"拍卖得标: {auc['rname']}")], '拍卖系统', 'auction')
+
+        conn.execute('UPDATE auctions SET status = "finished", finished_at = ? WHERE id = ?',
+                     (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), data['auction_id']))
+        return auc, fetch_event_rows(conn, [hid]) if hid else []
+    auc, events = writer.run(write)
+    broker.publish('auction', {'type': 'finished', 'auction_id': data['auction_id'],
+                               'winner_id': auc['highest_bidder_id'] if auc else None,
+                               'price': auc['current_price'] if auc else None})
+    for e in events: broker.publish('events', e)
+    bump_points_generation()
     return jsonify({'success': True})
 
 @app.route('/api/bounty/start', methods=['POST'])
@@ -649,26 +2108,29 @@ def start_bounty():
     """开启悬赏 (补全字段)"""
     try:
         data = request.json
-        conn = get_db_connection()
-        conn.execute('''
-            INSERT INTO bounties (
-                reward_id, class_id, target_points, type, description, 
-                allowed_reasons, start_date, end_date, status
-            ) VALUES (?, 1, ?, ?, ?, ?, ?, ?, "active")
-        ''', (
-            data['reward_id'], data['target_points'], data.get('type', 'individual'),
-            data.get('description', ''), data.get('allowed_reasons', ''),
-            data.get('start_date'), data.get('end_date')
-        ))
-        conn.commit()
-        conn.close()
+        def write(conn):
+            cur = conn.execute('''
+                INSERT INTO bounties (
+                    reward_id, class_id, target_points, type, description, 
+                    allowed_reasons, start_date, end_date, status
+                ) VALUES (?, 1, ?, ?, ?, ?, ?, ?, "active")
+            ''', (
+                data['reward_id'], data['target_points'], data.get('type', 'individual'),
+                data.get('description', ''), data.get('allowed_reasons', ''),
+                data.get('start_date'), data.get('end_date')
+            ))
+            # 开启时按规则补算已有记录，之后由触发器增量累计
+            backfill_bounty_progress(conn, cur.lastrowid)
+        writer.run(write)
+        broker.publish('bounties', {'type': 'started'})
         return jsonify({'success': True})
+    except WriteBusy: raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bounties/progress')
 def get_bounties_progress():
-    """获取悬赏进度 (精准规则匹配版)"""
+    """获取悬赏进度 (读取增量维护的 bounty_progress)"""
     try:
         conn = get_db_connection()
         today = datetime.now().strftime('%Y-%m-%d')
@@ -682,36 +2144,14 @@ def get_bounties_progress():
         
         res = []
         for b in rows:
-            # 理由过滤条件
-            reasons = b['allowed_reasons'].split(',') if b['allowed_reasons'] else []
-            reason_filter = ""
-            params = []
-            if reasons:
-                placeholders = ','.join(['?'] * len(reasons))
-                reason_filter = f" AND reason IN ({placeholders})"
-                params = reasons
-            
-            if b['type'] == 'group':
-                # 小组：在该悬赏规则下的累计加分 (取前三)
-                sql = f'''
-                    SELECT g.id, g.name, SUM(ph.change_amount) as current_points
-                    FROM groups g
-                    JOIN students s ON g.id = s.group_id
-                    JOIN points_history ph ON s.id = ph.student_id
-                    WHERE ph.status = 'approved' AND ph.change_amount > 0 {reason_filter}
-                    GROUP BY g.id ORDER BY current_points DESC LIMIT 3
-                '''
-                leader_rows = conn.execute(sql, params).fetchall()
-            else:
-                # 个人：在该悬赏规则下的累计加分 (取前三)
-                sql = f'''
-                    SELECT s.id, s.name, SUM(ph.change_amount) as current_points
-                    FROM students s
-                    JOIN points_history ph ON s.id = ph.student_id
-                    WHERE ph.status = 'approved' AND ph.change_amount > 0 {reason_filter}
-                    GROUP BY s.id ORDER BY current_points DESC LIMIT 3
-                '''
-                leader_rows = conn.execute(sql, params).fetchall()
+            # 进度由 bounty_progress 增量维护，这里只按索引取前三
+            target = 'groups' if b['type'] == 'group' else 'students'
+            leader_rows = conn.execute(f'''
+                SELECT t.id, t.name, bp.points as current_points
+                FROM bounty_progress bp JOIN {target} t ON t.id = bp.target_id
+                WHERE bp.bounty_id = ? AND bp.points > 0
+                ORDER BY bp.points DESC LIMIT 3
+            ''', (b['id'],)).fetchall()
 
             res.append({
                 'id': b['id'],
@@ -770,15 +2210,12 @@ def finish_bounty():
     bid = data.get('bounty_id')
     plan = data.get('plan', []) # 前端确认后的扣分方案
     
-    try:
-        conn = get_db_connection()
+    def write(conn):
         b = conn.execute('SELECT * FROM bounties WHERE id = ?', (bid,)).fetchone()
         
-        # 1. 严格按方案执行扣分
-        for item in plan:
-            conn.execute('UPDATE students SET points = points - ? WHERE id = ?', (item['deduct'], item['student_id']))
-            conn.execute('INSERT INTO points_history (student_id, change_amount, reason, teacher) VALUES (?, ?, ?, "悬赏结项")',
-                         (item['student_id'], -item['deduct'], f"达成悬赏: {data.get('reward_name')}"))
+        # 1. 严格按方案执行扣分 (直接生效，不进审核队列)
+        reason = f"达成悬赏: {data.get('reward_name')}"
+        hids, _ = post_ledger(conn, [(item['student_id'], -item['deduct'], reason) for item in plan], '悬赏结项', 'bounty')
 
         # 2. 扣除奖品库存
         conn.execute('UPDATE rewards SET stock = stock - 1 WHERE id = ?', (b['reward_id'],))
@@ -786,13 +2223,34 @@ def finish_bounty():
         # 3. 标记悬赏状态
         conn.execute('UPDATE bounties SET status = "finished", winner_id = ?, finished_at = ? WHERE id = ?',
                      (data.get('leader_id'), datetime.now().strftime('%Y-%m-%d %H:%M:%S'), bid))
-        
-        conn.commit()
-        conn.close()
+        return fetch_event_rows(conn, hids) if hids else []
+
+    try:
+        events = writer.run(write)
+        broker.publish('bounties', {'type': 'finished', 'bounty_id': bid})
+        for e in events: broker.publish('events', e)
+        generations.bump('rewards')
+        bump_points_generation()
         return jsonify({'success': True})
+    except WriteBusy: raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# 荣誉动态的统一查询列 (与 SSE 'events' 主题推送的数据结构一致)
+EVENT_COLUMNS = '''
+    SELECT ph.reason as reward_name, s.name as winner_name, 
+           ph.created_at as time,
+           CASE WHEN ph.kind IN ('auction', 'bounty') THEN ph.kind ELSE 'reward' END as type
+    FROM points_history ph
+    JOIN students s ON ph.student_id = s.id
+'''
+
+def fetch_event_rows(conn, history_ids):
+    """按积分记录 ID 取出荣誉动态 (用于写入后推送增量)"""
+    placeholders = ','.join(['?'] * len(history_ids))
+    rows = conn.execute(f'{EVENT_COLUMNS} WHERE ph.id IN ({placeholders}) ORDER BY ph.id', history_ids).fetchall()
+    return [dict(r) for r in rows]
+
 @app.route('/api/events/recent')
 def get_events_recent():
     """获取最近荣誉动态 (支持日期筛选)"""
@@ -803,27 +2261,18 @@ def get_events_recent():
         date_filter = ""
         params = []
         if date_str:
-            date_filter = " AND date(ph.created_at) = ?"
+            date_filter = " AND ph.created_date = ?"
             params = [date_str]
 
-        # 筛选逻辑：负分变动 且 包含特定关键词
+        # 筛选逻辑：兑换/拍卖/悬赏的扣分记录
         rows = conn.execute(f'''
-            SELECT ph.reason as reward_name, s.name as winner_name, 
-                   ph.created_at as time,
-                   CASE 
-                     WHEN ph.reason LIKE '拍卖%' THEN 'auction'
-                     WHEN ph.reason LIKE '达成悬赏%' THEN 'bounty'
-                     ELSE 'reward'
-                   END as type
-            FROM points_history ph
-            JOIN students s ON ph.student_id = s.id
-            WHERE ph.change_amount < 0 
-            AND (ph.reason LIKE '拍卖%' OR ph.reason LIKE '达成悬赏%' OR ph.reason LIKE '兑换%')
+            {EVENT_COLUMNS}
+            WHERE ph.kind IN ('auction', 'bounty', 'redemption') AND ph.change_amount < 0
             {date_filter}
             ORDER BY ph.created_at DESC LIMIT 20
         ''', params).fetchall()
         conn.close()
-        return jsonify([dict(r) for r in rows])
+        return jsonify(rows)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -833,86 +2282,123 @@ def get_events_recent():
 def submit_audit():
     try:
         data = request.json
-        conn = get_db_connection()
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         change_amount = int(data.get('change_amount', 0))
-        submitted_ids = set(data.get('student_ids', []))
+        submitted_ids = {int(i) for i in data.get('student_ids', [])}
         reason = data.get('reason', '自助申报')
         submitter = data.get('submitter', '自助')
         
         # 核心判断：是否触发“基本准则”逻辑 (负分 且 属于学业/班级管理)
         is_benchmark_rule = change_amount < 0 and ('[学业管理' in reason or '[班级管理' in reason)
-
-        if is_benchmark_rule:
-            # === 模式 A：基本准则管理 (自动生效，无需审核) ===
-            # 1. 扣分部分：仅针对名单内的人
-            if submitted_ids:
-                neg_records = []
-                for sid in submitted_ids:
-                    # 状态直接为 approved
-                    neg_records.append((sid, change_amount, reason, submitter, "approved", now))
-                    # 实时扣分
-                    conn.execute('UPDATE students SET points = points + ? WHERE id = ?', (change_amount, sid))
-                conn.executemany('INSERT INTO points_history (student_id, change_amount, reason, teacher, status, created_at) VALUES (?, ?, ?, ?, ?, ?)', neg_records)
-
-            # 2. 奖励部分：全班 - 扣分名单 = 达标名单
-            all_students = conn.execute('SELECT id FROM students').fetchall()
-            all_ids = {s['id'] for s in all_students}
-            bonus_ids = all_ids - submitted_ids
-            
-            if bonus_ids:
-                try:
-                    simple_reason = reason.split('] ')[-1]
-                except:
-                    simple_reason = "日常规范"
-                bonus_reason = f"[基本准则] {simple_reason} - 达标奖励"
+        # 模式 B 仅针对选中的人
+        if not is_benchmark_rule and not submitted_ids:
+            return jsonify({'error': '未选择学生'}), 400
+
+        def write(conn):
+            if is_benchmark_rule:
+                # === 模式 A：基本准则管理 (自动生效，无需审核) ===
+                # 1. 扣分部分：仅针对名单内的人，直接生效
+                post_ledger(conn, [(sid, change_amount, reason) for sid in submitted_ids], submitter, 'benchmark_penalty', created_at=now)
+
+                # 2. 奖励部分：全班 - 扣分名单 = 达标名单
+                all_ids = {s['id'] for s in conn.execute('SELECT id FROM students')}
+                bonus_ids = all_ids - submitted_ids
                 
-                bonus_records = []
-                for bid in bonus_ids:
-                    # 状态直接为 approved
-                    bonus_records.append((bid, 2, bonus_reason, f"系统({submitter})", "approved", now))
-                    # 实时加分
-                    conn.execute('UPDATE students SET points = points + 2 WHERE id = ?', (bid,))
-                conn.executemany('INSERT INTO points_history (student_id, change_amount, reason, teacher, status, created_at) VALUES (?, ?, ?, ?, ?, ?)', bonus_records)
+                if bonus_ids:
+                    try:
+                        simple_reason = reason.split('] ')[-1]
+                    except:
+                        simple_reason = "日常规范"
+                    bonus_reason = f"[基本准则] {simple_reason} - 达标奖励"
+                    post_ledger(conn, [(bid, 2, bonus_reason) for bid in bonus_ids], f"系统({submitter})", 'benchmark_bonus', created_at=now)
 
-        else:
-            # === 模式 B：普通加减分 (荣誉/自定义等) ===
-            # 仅针对选中的人，不触发全员逻辑
-            if not submitted_ids:
-                return jsonify({'error': '未选择学生'}), 400
-                
-            records = []
-            for sid in submitted_ids:
-                records.append((sid, change_amount, reason, submitter, "pending", now))
-            conn.executemany('INSERT INTO points_history (student_id, change_amount, reason, teacher, status, created_at) VALUES (?, ?, ?, ?, ?, ?)', records)
+            else:
+                # === 模式 B：普通加减分 (荣誉/自定义等)，进入待审核 ===
+                kind = 'redemption' if reason.startswith('兑换') else 'manual'
+                post_ledger(conn, [(sid, change_amount, reason) for sid in submitted_ids], submitter, kind, 'pending', now)
 
-        conn.commit()
-        conn.close()
+        writer.run(write)
+        # 待审核记录不影响积分，只有基本准则模式 (直接生效) 需要刷新排行榜
+        if is_benchmark_rule: bump_points_generation()
         return jsonify({'success': True})
+    except WriteBusy: raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/points/bulk', methods=['POST'])
+def bulk_points():
+    """批量直接记账 (跳过审核)：{"entries": [{"student_id", "delta", "reason"}], "teacher"}
+    全部条目在同一事务内生效，返回涉及学生的新余额；任一学生不存在则整批不生效"""
+    data = request.json or {}
+    try:
+        entries = [(int(e['student_id']), int(e['delta']), str(e.get('reason') or '批量调整')) for e in data.get('entries', [])]
+    except (TypeError, ValueError, KeyError):
+        return jsonify({'error': '参数错误'}), 400
+    if not entries: return jsonify({'error': '未选择学生'}), 400
+    try:
+        _, balances = writer.run(post_ledger, entries, data.get('teacher', '系统'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except WriteBusy: raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    bump_points_generation()
+    return jsonify({'success': True, 'count': len(entries),
+                    'balances': [{'id': sid, 'points': pts} for sid, pts in balances.items()]})
 
 @app.route('/api/audit/pending')
 def get_pending():
+    """待审核列表 (按提交时间先后)，积压较多时可用 ?limit=&after= 分页"""
+    try:
+        limit, after = page_request((str, int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     conn = get_db_connection()
-    rows = conn.execute('SELECT ph.*, s.name as student_name FROM points_history ph JOIN students s ON ph.student_id = s.id WHERE ph.status = "pending"').fetchall()
+    sql = f'''
+        SELECT ph.*, s.name as student_name FROM points_history ph JOIN students s ON ph.student_id = s.id
+        WHERE ph.status = 'pending' {'AND (ph.created_at, ph.id) > (?, ?)' if after else ''}
+        ORDER BY ph.created_at, ph.id
+    '''
+    if limit is None:
+        rows = conn.execute(sql).fetchall()
+        conn.close()
+        return jsonify(rows)
+    rows = conn.execute(sql + ' LIMIT ?', (after or []) + [limit + 1]).fetchall()
     conn.close()
-    return jsonify([dict(r) for r in rows])
+    items, next_cursor = page_result(rows, limit, lambda r: (r['created_at'], r['id']))
+    return jsonify({'items': items, 'next_cursor': next_cursor})
 
 @app.route('/api/audit/process', methods=['POST'])
 def process_audit():
+    """批量审核：只处理仍为 pending 的记录，重复提交不会重复加分"""
     data = request.json
-    conn = get_db_connection()
-    for aid in data['audit_ids']:
-        if data['action'] == 'approve':
-            record = conn.execute('SELECT * FROM points_history WHERE id = ?', (aid,)).fetchone()
-            conn.execute('UPDATE students SET points = points + ? WHERE id = ?', (record['change_amount'], record['student_id']))
-            conn.execute('UPDATE points_history SET status = "approved" WHERE id = ?', (aid,))
-        else:
-            conn.execute('UPDATE points_history SET status = "rejected" WHERE id = ?', (aid,))
-    conn.commit()
-    return jsonify({'success': True})
+    try:
+        ids = [int(i) for i in data.get('audit_ids', [])]
+    except (TypeError, ValueError):
+        return jsonify({'error': '参数错误'}), 400
+    approve = data.get('action') == 'approve'
+    def write(conn):
+        # 1. 一条语句完成状态流转，RETURNING 拿到本次真正生效的记录
+        applied = conn.execute('''
+            UPDATE points_history SET status = ?
+            WHERE id IN (SELECT value FROM json_each(?)) AND status = 'pending'
+            RETURNING student_id, change_amount
+        ''', ('approved' if approve else 'rejected', json.dumps(ids))).fetchall()
+        # 2. 按学生汇总后一条语句更新余额
+        if approve and applied:
+            apply_balance_deltas(conn, [(r['student_id'], r['change_amount']) for r in applied])
+        return applied
+    try:
+        applied = writer.run(write)
+    except WriteBusy: raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    if approve and applied:
+        # 审核通过可能推进悬赏进度，通知客户端重新拉取
+        broker.publish('bounties', {'type': 'progress'})
+        bump_points_generation()
+    return jsonify({'success': True, 'applied': len(applied), 'requested': len(ids)})
 
 # --- 5. 权限与路由 ---
 
@@ -920,9 +2406,9 @@ def process_audit():
 def check_auth():
     # 终极简化版白名单 (加入排行榜、学生、小组、申报、彩蛋等接口)
     allowed = ['/login', '/static', '/student_portal', '/grocery_shop', '/auction', '/bounties', '/author',
-               '/api/system/info', '/api/system/setup', '/api/students', '/api/groups', 
+               '/assets', '/api/system/info', '/api/system/setup', '/api/students', '/api/groups', 
                '/api/point_standards', '/api/audit/submit', '/api/rewards', '/api/tunnel',
-               '/api/auction/current', '/api/bounties/progress', '/api/events/recent', '/api/ranking']
+               '/api/auction/current', '/api/bounties/progress', '/api/events/recent', '/api/ranking', '/api/stream']
     if any(request.path.startswith(p) for p in allowed): return
     if 'logged_in' not in session: return redirect(url_for('login'))
 
@@ -965,37 +2451,102 @@ def get_system_password():
         return '123456'
     with open(pwd_file, 'r', encoding='utf-8') as f: return f.read().strip()
 
+def student_rank(conn, sid):
+    """按排行榜顺序 (积分降序、姓名升序) 计算名次：走 idx_stu_rank 计数排在前面的人数，返回 (名次, 积分)"""
+    me = conn.execute('SELECT points, name FROM students WHERE id = ?', (sid,)).fetchone()
+    if not me: return None
+    ahead = conn.execute('''
+        SELECT COUNT(*) FROM students
+        WHERE points > :p OR (points = :p AND (name < :n OR (name = :n AND id < :id)))
+    ''', {'p': me['points'], 'n': me['name'], 'id': sid}).fetchone()[0]
+    return ahead + 1, me['points']
+
+@app.route('/api/students/<int:sid>/rank', methods=['GET'])
+@conditional('points')
+def get_student_rank(sid):
+    """单独查询学生名次"""
+    conn = get_db_connection()
+    res = student_rank(conn, sid)
+    total = conn.execute('SELECT COUNT(*) FROM students').fetchone()[0] if res else 0
+    conn.close()
+    if not res: return jsonify({'error': '学生不存在'}), 404
+    return jsonify({'student_id': sid, 'rank': res[0], 'points': res[1], 'total': total})
+
 @app.route('/api/students/<int:sid>/history', methods=['GET'])
 def get_student_history(sid):
     """获取单个学生的积分明细"""
     try:
         conn = get_db_connection()
         # 1. 获取基本信息和排名
-        all_students = conn.execute('SELECT id, points FROM students ORDER BY points DESC, name ASC').fetchall()
-        rank = -1
-        points = 0
-        for i, s in enumerate(all_students):
-            if s['id'] == sid:
-                rank = i + 1
-                points = s['points']
-                break
-        
-        # 2. 获取最近 20 条历史
-        history = conn.execute('''
+        rank, points = student_rank(conn, sid) or (-1, 0)
+
+        # 2. 获取最近历史 (默认 20 条，next_cursor 可继续向前翻页)
+        limit, after = page_request((str, int), default_limit=20)
+        history = conn.execute(f'''
             SELECT ph.* FROM points_history ph 
             WHERE ph.student_id = ? AND ph.status = 'approved'
-            ORDER BY ph.created_at DESC LIMIT 20
-        ''', (sid,)).fetchall()
+            {'AND (ph.created_at, ph.id) < (?, ?)' if after else ''}
+            ORDER BY ph.created_at DESC, ph.id DESC LIMIT ?
+        ''', [sid] + (after or []) + [limit + 1]).fetchall()
         
         conn.close()
+        items, next_cursor = page_result(history, limit, lambda r: (r['created_at'], r['id']))
         return jsonify({
             'points': points,
             'rank': rank,
-            'history': [dict(h) for h in history]
+            'history': items,
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+TREND_BUCKETS = {
+    'day': 'day',
+    'week': "date(day, '-6 days', 'weekday 1')",  # 所在周的周一
+    'month': 'substr(day, 1, 7)',
+}
+
+@app.route('/api/students/<int:sid>/trend', methods=['GET'])
+@conditional('points')
+def get_student_trend(sid):
+    """学生积分趋势：?bucket=day|week|month&from=&to= (YYYY-MM-DD)，只读 points_daily 汇总表。
+    每个时间段给出加分、扣分、净变化与条数，并按理由的区域/类别拆开"""
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in TREND_BUCKETS: return jsonify({'error': 'bucket 只能是 day / week / month'}), 400
+    start, end = request.args.get('from'), request.args.get('to')
+    try:
+        for d in (start, end):
+            if d: datetime.strptime(d, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': '日期格式应为 YYYY-MM-DD'}), 400
+    where, params = ['student_id = ?'], [sid]
+    if start: where.append('day >= ?'); params.append(start)
+    if end: where.append('day <= ?'); params.append(end)
+    if request.args.get('all') != '1':  # 趋势默认不计花积分与记账类来源，?all=1 全部计入
+        where.append(f"kind NOT IN ({','.join('?' * len(NON_EARNING_KINDS))})"); params += NON_EARNING_KINDS
+
+    conn = get_db_connection()
+    if not conn.execute('SELECT 1 FROM students WHERE id = ?', (sid,)).fetchone():
+        conn.close()
+        return jsonify({'error': '学生不存在'}), 404
+    rows = conn.execute(f'''
+        SELECT {TREND_BUCKETS[bucket]} AS period, area, category, SUM(plus) AS plus, SUM(minus) AS minus, SUM(count) AS count
+        FROM points_daily WHERE {' AND '.join(where)}
+        GROUP BY 1, 2, 3 HAVING SUM(count) > 0 ORDER BY 1, 2, 3
+    ''', params).fetchall()
+    conn.close()
+
+    series = []
+    for r in rows:
+        if not series or series[-1]['period'] != r['period']:
+            series.append({'period': r['period'], 'plus': 0, 'minus': 0, 'net': 0, 'count': 0, 'areas': []})
+        cur = series[-1]
+        cur['plus'] += r['plus']; cur['minus'] += r['minus']; cur['net'] += r['plus'] + r['minus']; cur['count'] += r['count']
+        cur['areas'].append({'area': r['area'], 'category': r['category'], 'plus': r['plus'], 'minus': r['minus'], 'count': r['count']})
+    return jsonify({'student_id': sid, 'bucket': bucket, 'from': start, 'to': end, 'series': series})
+
 @app.route('/api/verify_password', methods=['POST'])
 def verify_password_api():
     data = request.json
@@ -1017,10 +2568,92 @@ def login():
         return jsonify({'success': False}), 403
     return render_template('login.html')
 
+def _cell_text(v):
+    """Excel 单元格转文本：数字学号 2025001.0 还原为 '2025001'"""
+    if v is None: return ''
+    if isinstance(v, float) and v.is_integer(): v = int(v)
+    return str(v).strip()
+
+@app.route('/api/students/import', methods=['POST'])
+def import_students():
+    """按模板批量导入学生 (姓名、学号、分组、初始积分)：流式解析，单事务写入，逐行返回校验结果"""
+    if 'file' not in request.files:
+        return jsonify({'error': '未上传文件'}), 400
+    file = request.files['file']
+    if not file or not file.filename:
+        return jsonify({'error': '无效文件'}), 400
+
+    # 1. 流式解析 + 逐行校验
+    report, valid, seen = [], [], set()
+    try:
+        from openpyxl import load_workbook
+        wb = load_workbook(file, read_only=True, data_only=True)
+        try:
+            for idx, row in enumerate(wb.active.iter_rows(min_row=2, max_col=4, values_only=True), start=2):
+                name, sno, group, pts = (list(row) + [None] * 4)[:4]
+                name, sno, group = _cell_text(name), _cell_text(sno), _cell_text(group)
+                if not name and not sno: continue  # 空行
+                error = None
+                if not name: error = '姓名为空'
+                elif not sno: error = '学号为空'
+                elif sno in seen: error = f'学号 {sno} 在文件中重复'
+                else:
+                    try: pts = int(float(pts)) if pts not in (None, '') else 0
+                    except (TypeError, ValueError): error = f'初始积分无效: {pts}'
+                if error:
+                    report.append({'row': idx, 'student_id': sno, 'status': 'error', 'message': error})
+                    continue
+                seen.add(sno)
+                valid.append((idx, name, sno, group, pts))
+        finally:
+            wb.close()
+    except Exception as e:
+        return jsonify({'error': f"解析文件失败: {str(e)}"}), 400
+
+    # 2. 单事务写入：一次建齐缺失小组，新学生插入，已存在的学号只更新姓名与分组 (不重置积分)
+    def write(conn):
+        groups = {r['name']: r['id'] for r in conn.execute('SELECT id, name FROM groups').fetchall()}
+        new_groups = sorted({v[3] for v in valid if v[3] and v[3] not in groups})
+        conn.executemany('INSERT OR IGNORE INTO groups (class_id, name) VALUES (1, ?)', [(n,) for n in new_groups])
+        if new_groups:
+            groups = {r['name']: r['id'] for r in conn.execute('SELECT id, name FROM groups').fetchall()}
+
+        existing = {r['student_id'] for r in conn.execute(
+            'SELECT student_id FROM students WHERE student_id IN (SELECT value FROM json_each(?))',
+            (json.dumps([v[2] for v in valid]),)).fetchall()}
+        inserts = [(name, sno, groups.get(group), pts) for _, name, sno, group, pts in valid if sno not in existing]
+        updates = [(name, groups.get(group), sno) for _, name, sno, group, _ in valid if sno in existing]
+        conn.executemany('INSERT INTO students (class_id, name, student_id, group_id, points) VALUES (1, ?, ?, ?, ?)', inserts)
+        conn.executemany('UPDATE students SET name = ?, group_id = COALESCE(?, group_id) WHERE student_id = ?', updates)
+
+        # 初始积分写入明细账，保证余额与历史记录一致
+        opening = {sno: pts for _, sno, _, pts in inserts if pts}
+        if opening:
+            ids = conn.execute('SELECT id, student_id FROM students WHERE student_id IN (SELECT value FROM json_each(?))',
+                               (json.dumps(list(opening)),)).fetchall()
+            conn.executemany('INSERT INTO points_history (student_id, change_amount, reason, teacher, status, kind, created_date) VALUES (?, ?, "初始积分", "系统", "approved", "opening", CURRENT_DATE)',
+                             [(r['id'], opening[r['student_id']]) for r in ids])
+        return new_groups, existing, inserts, updates
+    try:
+        new_groups, existing, inserts, updates = writer.run(write)
+    except WriteBusy: raise
+    except Exception as e:
+        return jsonify({'error': f"导入失败: {str(e)}"}), 500
+    bump_points_generation()
+
+    for idx, _, sno, _, _ in valid:
+        report.append({'row': idx, 'student_id': sno, 'status': 'updated' if sno in existing else 'inserted', 'message': ''})
+    report.sort(key=lambda r: r['row'])
+    errors = [f"第 {r['row']} 行: {r['message']}" for r in report if r['status'] == 'error']
+    return jsonify({'success': True, 'success_count': len(valid), 'fail_count': len(errors),
+                    'inserted': len(inserts), 'updated': len(updates), 'created_groups': new_groups,
+                    'errors': errors, 'report': report})
+
 @app.route('/api/students/template', methods=['GET'])
 def download_student_template():
     """下载学生导入模板 (带细则与样例)"""
     try:
+        from openpyxl import Workbook
         wb = Workbook()
         ws = wb.active
         ws.title = "学生名单填报"
@@ -1057,10 +2690,118 @@ def download_student_template():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+startup_mark('注册路由')
+
+# --- 6. 生产模式 (waitress) ---
+def serve_production(host, port, threads, workers=1):
+    """用 waitress 多线程服务 (HTTP/1.1 长连接、空闲超时、连接数上限)。
+    POSIX 上 workers > 1 时先绑定端口，再 fork 出多个 worker 共享监听 socket 与同一个 WAL 数据库，
+    父进程只负责定时备份与拉起意外退出的 worker。写入代次放在共享内存里，ETag 与排行榜缓存跨进程一致；
+    SSE 推送与隧道状态仍是进程内的，多进程时只有连到同一 worker 的订阅者能收到推送。
+    每个进程至多 threads - SERVE_REQUEST_THREADS 个 SSE 订阅，其余线程始终留给普通请求；连接池上限与线程数一致。"""
+    broker.max_subscribers = max(0, threads - Config.SERVE_REQUEST_THREADS)
+    db_pool.size = threads
+    options = dict(threads=threads, channel_timeout=Config.SERVE_CHANNEL_TIMEOUT,
+                   connection_limit=Config.SERVE_CONNECTION_LIMIT, backlog=Config.SERVE_BACKLOG,
+                   ident='class-points-manager')
+    import waitress
+    if workers <= 1 or not hasattr(os, 'fork'):
+        backups.start_scheduler()
+        reconciler.start_scheduler()
+        waitress.serve(app, host=host, port=port, **options)
+        return
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(Config.SERVE_BACKLOG)
+    generations.share()
+    # 子进程不能继承已打开的 SQLite 连接，各自按需重新连接
+    db_pool.close_all()
+    options.pop('backlog')
+
+    def spawn():
+        pid = os.fork()
+        if pid: return pid
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            waitress.serve(app, sockets=[sock], **options)
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print(f'worker {os.getpid()} 异常退出: {e}')
+            code = 1
+        finally:
+            os._exit(code)
+
+    children = {spawn() for _ in range(workers)}
+    backups.start_scheduler()
+    reconciler.start_scheduler()
+
+    def stop(signum, frame): raise SystemExit(0)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while True:
+            pid, status = os.wait()
+            children.discard(pid)
+            print(f'worker {pid} 已退出 (状态 {status})，1 秒后重新拉起')
+            time.sleep(1)
+            children.add(spawn())
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in children:
+            try: os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError: pass
+        for pid in children:
+            try: os.waitpid(pid, 0)
+            except ChildProcessError: pass
+
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(description='班级积分管理系统')
+
+    parser.add_argument('--serve', action='store_true', help='生产模式：用 waitress 多线程服务 (打包版默认开启)')
+
+    parser.add_argument('--dev', action='store_true', help='使用 Flask 开发服务器')
+
+    parser.add_argument('--host', default='0.0.0.0')
+
+    parser.add_argument('--port', type=int, default=Config.PORT)
+
+    parser.add_argument('--threads', type=int, default=Config.SERVE_THREADS, help=f'每个进程的工作线程数 (其中 {Config.SERVE_REQUEST_THREADS} 个留给普通请求，其余供 SSE 推送)')
+
+    parser.add_argument('--workers', type=int, default=Config.SERVE_WORKERS, help='预派生进程数 (仅 Linux/macOS)')
+
+    args = parser.parse_args()
+
+    serve = (args.serve or getattr(sys, 'frozen', False)) and not args.dev
+
+    if serve and importlib.util.find_spec('waitress') is None:
+
+        print("未安装 waitress (pip install waitress)，改用开发服务器")
+
+        serve = False
+
+    workers = args.workers if hasattr(os, 'fork') else 1
+
+    
+
     init_db()
 
+    startup_mark('建库/迁移')
+
+    assets.build()
+
+    startup_mark('静态资源')
+
+    if not serve:
+
+        backups.start_scheduler()
+
+        reconciler.start_scheduler()
+
     
 
     # 自动获取局域网 IP (方便手机访问)
@@ -1079,7 +2820,9 @@ if __name__ == '__main__':
 
 
 
-    port = 5001
+    port = args.port
+
+    Config.PORT = port
 
     url = f"http://localhost:{port}"
 
@@ -1091,6 +2834,8 @@ if __name__ == '__main__':
 
     print(f"【手机端访问】: http://{local_ip}:{port}")
 
+    if serve: print(f"【服务模式】: waitress {args.threads} 线程 x {workers} 进程 (每进程实时推送至多 {max(0, args.threads - Config.SERVE_REQUEST_THREADS)} 个连接)")
+
     print("=" * 60)
 
 
@@ -1105,4 +2850,6 @@ if __name__ == '__main__':
 
 
 
-    app.run(host='0.0.0.0', port=port, debug=False)
+    if serve: serve_production(args.host, port, args.threads, workers)
+
+    else: app.run(host=args.host, port=port, debug=False)
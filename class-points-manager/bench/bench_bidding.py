@@ -0,0 +1,85 @@
+"""
+拍卖竞价并发压测：100 个竞买人同时出价，校验不丢价、不倒挂、不超额
+
+用法: python bench/bench_bidding.py [--bidders 100] [--rounds 20]
+"""
+import argparse, os, random, sqlite3, sys, tempfile, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as points_app
+
+def setup(path, bidders):
+    points_app.Config.DATABASE_PATH = path
+    points_app.db_pool.path = path
+    points_app.init_db()
+    conn = sqlite3.connect(path)
+    rnd = random.Random(7)
+    conn.executemany('INSERT INTO students (id, name, student_id, points) VALUES (?, ?, ?, ?)',
+                     [(i, f'竞买人{i}', f'B{i:04d}', rnd.randint(50, 500)) for i in range(1, bidders + 1)])
+    conn.execute('INSERT INTO rewards (id, name, points_cost) VALUES (1, "压测奖品", 0)')
+    conn.execute('INSERT INTO auctions (id, reward_id, current_price, status) VALUES (1, 1, 0, "active")')
+    conn.commit()
+    conn.close()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--bidders', type=int, default=100)
+    ap.add_argument('--rounds', type=int, default=20, help='每个竞买人的出价次数')
+    args = ap.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    setup(path, args.bidders)
+    points_app.app.config['TESTING'] = True
+
+    in_flight = [0, 0]  # 当前并发数, 峰值并发数
+    lock = threading.Lock()
+    results = []
+    barrier = threading.Barrier(args.bidders)
+
+    def bidder(sid):
+        client = points_app.app.test_client()
+        with client.session_transaction() as sess: sess['logged_in'] = True
+        rnd = random.Random(sid)
+        barrier.wait()
+        for _ in range(args.rounds):
+            cur = client.get('/api/auction/current').get_json()
+            amount = (cur['current_price'] if cur else 0) + rnd.randint(1, 5)
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            res = client.post('/api/auction/bid', json={'auction_id': 1, 'student_id': sid, 'amount': amount})
+            with lock: in_flight[0] -= 1
+            results.append((sid, amount, res.status_code, res.get_json()))
+
+    threads = [threading.Thread(target=bidder, args=(i,)) for i in range(1, args.bidders + 1)]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - t0
+
+    conn = sqlite3.connect(path)
+    final_price, final_leader = conn.execute('SELECT current_price, highest_bidder_id FROM auctions WHERE id = 1').fetchone()
+    accepted = conn.execute('SELECT student_id, amount FROM bids WHERE auction_id = 1 AND accepted = 1 ORDER BY id').fetchall()
+    logged = conn.execute('SELECT COUNT(*) FROM bids WHERE auction_id = 1').fetchone()[0]
+    balances = dict(conn.execute('SELECT id, points FROM students').fetchall())
+    conn.close()
+
+    ok = [r for r in results if r[2] == 200]
+    errors = {}
+    for r in results:
+        if r[2] != 200: errors[r[3].get('error')] = errors.get(r[3].get('error'), 0) + 1
+
+    # 校验: 没有出价因异常丢失、每次出价都有日志、成功出价严格递增、最终价等于最高成功出价、无人超额出价
+    assert len(results) == args.bidders * args.rounds, '有出价请求异常中断'
+    assert logged == len(results), (logged, len(results))
+    assert len(accepted) == len(ok), (len(accepted), len(ok))
+    assert all(a[1] < b[1] for a, b in zip(accepted, accepted[1:])), '成功出价出现倒挂'
+    assert accepted and (final_leader, final_price) == tuple(accepted[-1]), '最终成交价与最高出价不一致'
+    assert all(amount <= balances[sid] for sid, amount in accepted), '存在超出积分的成功出价'
+
+    print(f'{args.bidders} 个竞买人 x {args.rounds} 次 = {len(results)} 次出价, 耗时 {elapsed:.2f}s ({len(results) / elapsed:.0f} 次/秒)')
+    print(f'成功 {len(ok)} 次, 拒绝 {dict(errors)}, 峰值并发请求 {in_flight[1]}')
+    print(f'最终价 {final_price} (竞买人 {final_leader}), 全部校验通过')
+
+if __name__ == '__main__':
+    main()
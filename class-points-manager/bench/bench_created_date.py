@@ -0,0 +1,95 @@
+"""
+按天统计基准：date(created_at) 函数过滤 vs created_date 索引列
+
+用法: python bench/bench_created_date.py [--rows 1000000] [--students 2000]
+"""
+import argparse, os, random, sqlite3, sys, tempfile, time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as points_app
+
+OLD_DAY_SQL = '''
+    SELECT ph.*, s.name as student_name
+    FROM points_history ph JOIN students s ON ph.student_id = s.id
+    WHERE ph.status = 'approved' AND ph.change_amount > 0 AND date(ph.created_at) = ?
+    ORDER BY ph.created_at DESC
+'''
+NEW_DAY_SQL = '''
+    SELECT ph.*, s.name as student_name
+    FROM points_history ph JOIN students s ON ph.student_id = s.id
+    WHERE ph.created_date = ? AND ph.status = 'approved' AND ph.change_amount > 0
+    ORDER BY ph.created_at DESC
+'''
+OLD_RANGE_SQL = '''
+    SELECT s.id, COALESCE(SUM(ph.change_amount), 0) as points
+    FROM students s
+    LEFT JOIN points_history ph ON s.id = ph.student_id AND ph.status = 'approved'
+         AND date(ph.created_at) BETWEEN ? AND ?
+    GROUP BY s.id ORDER BY points DESC
+'''
+NEW_RANGE_SQL = '''
+    SELECT s.id, COALESCE(d.points, 0) as points
+    FROM students s
+    LEFT JOIN (SELECT student_id, SUM(change_amount) as points FROM points_history
+               WHERE created_date BETWEEN ? AND ? AND status = 'approved'
+               GROUP BY student_id) d ON s.id = d.student_id
+    ORDER BY points DESC
+'''
+
+def build(path, rows, students, days=180):
+    points_app.Config.DATABASE_PATH = path
+    points_app.init_db()
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO students (id, name, student_id, points) VALUES (?, ?, ?, 0)',
+                     [(i, f'学生{i}', f'S{i:06d}') for i in range(1, students + 1)])
+    rnd = random.Random(42)
+    start = datetime(2025, 9, 1)
+    batch = []
+    for i in range(rows):
+        ts = start + timedelta(seconds=rnd.randrange(days * 86400))
+        batch.append((rnd.randint(1, students), rnd.choice([-10, -5, -2, 2, 5, 10, 15]),
+                      '[学业管理/语文] 作业缺交/抄袭/敷衍', 'approved',
+                      ts.strftime('%Y-%m-%d %H:%M:%S'), ts.strftime('%Y-%m-%d')))
+        if len(batch) == 50000:
+            conn.executemany('INSERT INTO points_history (student_id, change_amount, reason, status, created_at, created_date) VALUES (?, ?, ?, ?, ?, ?)', batch)
+            batch = []
+    if batch:
+        conn.executemany('INSERT INTO points_history (student_id, change_amount, reason, status, created_at, created_date) VALUES (?, ?, ?, ?, ?, ?)', batch)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+def timeit(conn, sql, params, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rows', type=int, default=1000000)
+    ap.add_argument('--students', type=int, default=2000)
+    ap.add_argument('--repeat', type=int, default=5)
+    args = ap.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    t0 = time.perf_counter()
+    build(path, args.rows, args.students)
+    print(f'生成 {args.rows} 条历史记录: {time.perf_counter() - t0:.1f}s ({path})')
+
+    conn = sqlite3.connect(path)
+    cases = [
+        ('单日荣誉榜', OLD_DAY_SQL, NEW_DAY_SQL, ('2025-10-08',)),
+        ('区间排行榜(7天)', OLD_RANGE_SQL, NEW_RANGE_SQL, ('2025-10-01', '2025-10-07')),
+    ]
+    for name, old_sql, new_sql, params in cases:
+        old_ms = timeit(conn, old_sql, params, args.repeat)
+        new_ms = timeit(conn, new_sql, params, args.repeat)
+        print(f'{name}: date(created_at) {old_ms:8.1f} ms | created_date {new_ms:8.1f} ms | {old_ms / new_ms:6.1f}x')
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+对账压测：增量检查点对账与全量汇总的耗时对比
+
+用法: python bench/bench_reconcile.py --db /tmp/district.db [--writes 2000] [--approve 200] [--rounds 5]
+
+数据库先复制到临时目录。首次对账建立检查点 (全量汇总一次)；之后每轮先写入一批新流水、审核通过一批旧的待审核记录，
+再分别计时增量对账与直接 GROUP BY 全表汇总，并校验两者得到的合计一致。
+"""
+import argparse, os, random, shutil, sqlite3, statistics, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as points_app
+
+FULL_SQL = "SELECT student_id, SUM(change_amount) FROM points_history WHERE status = 'approved' GROUP BY student_id"
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--db', required=True, help='generate.py 生成的数据库')
+    ap.add_argument('--writes', type=int, default=2000, help='每轮新写入的流水条数')
+    ap.add_argument('--approve', type=int, default=200, help='每轮审核通过的旧待审核记录数')
+    ap.add_argument('--rounds', type=int, default=5)
+    ap.add_argument('--seed', type=int, default=11)
+    args = ap.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    path = os.path.join(work_dir, 'bench.db')
+    shutil.copy(args.db, path)
+    points_app.Config.DATABASE_PATH = points_app.db_pool.path = path
+    points_app.Config.BACKUP_DIR, points_app.Config.RECONCILE_INTERVAL_HOURS = os.path.join(work_dir, 'backups'), 0
+    try:
+        points_app.init_db()
+        rnd = random.Random(args.seed)
+        conn = sqlite3.connect(path)
+        rows = conn.execute('SELECT COUNT(*) FROM points_history').fetchone()[0]
+        ids = [r[0] for r in conn.execute('SELECT id FROM students')]
+        pending = [r[0] for r in conn.execute("SELECT id FROM points_history WHERE status = 'pending'")]
+        rnd.shuffle(pending)
+
+        first = points_app.reconciler.run()
+        print(f"{rows} 条流水 / {len(ids)} 名学生；建立检查点 (全量) {first['ms']:.0f} ms，发现 {len(first['drift'])} 人不一致")
+        inc, full = [], []
+        for _ in range(args.rounds):
+            # 模拟一天的课堂写入：新流水走记账入口，旧的待审核记录审核通过
+            entries = [(rnd.choice(ids), rnd.choice([1, 2, -1, -2]), '[压测] 对账') for _ in range(args.writes)]
+            approve = [pending.pop() for _ in range(min(args.approve, len(pending)))]
+            conn.execute('BEGIN IMMEDIATE')
+            conn.row_factory = sqlite3.Row
+            points_app.post_ledger(conn, entries, '压测')
+            applied = conn.execute("UPDATE points_history SET status = 'approved' WHERE id IN (SELECT value FROM json_each(?)) AND status = 'pending' RETURNING student_id, change_amount",
+                                   (str(approve),)).fetchall()
+            points_app.apply_balance_deltas(conn, [(r['student_id'], r['change_amount']) for r in applied])
+            conn.commit()
+            conn.row_factory = None
+
+            t0 = time.perf_counter()
+            report = points_app.reconciler.run()
+            inc.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            totals = dict(conn.execute(FULL_SQL))
+            full.append((time.perf_counter() - t0) * 1000)
+            sums = dict(conn.execute('SELECT student_id, total FROM ledger_sums'))
+            assert all(sums.get(k, 0) == v for k, v in totals.items()), '检查点合计与全量汇总不一致'
+            assert len(report['drift']) == len(first['drift']), ('新写入不应产生差额', report['drift'])
+        conn.close()
+        print(f"每轮 {args.writes} 条新流水 + {args.approve} 条审核通过：增量对账 p50 {statistics.median(inc):.1f} ms，"
+              f"全量汇总 p50 {statistics.median(full):.1f} ms ({statistics.median(full) / statistics.median(inc):.0f} 倍)")
+    finally:
+        points_app.db_pool.close_all()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
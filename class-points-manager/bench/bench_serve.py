@@ -0,0 +1,130 @@
+"""
+HTTP 吞吐压测：同一套负载分别打 Flask 开发服务器与生产模式 (waitress 多线程 / 预派生多进程)
+
+用法: python bench/bench_serve.py --db /tmp/school.db [--clients 50] [--seconds 15] [--servers dev,serve,serve:4]
+
+服务器在子进程里启动 (serve:N 表示 N 个预派生 worker)，数据库先复制到临时目录。
+负载模拟学生手机与投屏：多数是排行榜、名单 (带 If-None-Match 复查)、名次与动态的读请求，约一成快捷加分。
+"""
+import argparse, http.client, json, os, random, shutil, socket, subprocess, sys, tempfile, threading, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER = '''
+import sys
+sys.path.insert(0, {root!r})
+import app as points_app
+C = points_app.Config
+C.DATABASE_PATH = points_app.db_pool.path = {db!r}
+C.BACKUP_DIR, C.BACKUP_INTERVAL_HOURS = {backups!r}, 0
+points_app.init_db()
+if {workers} == 0: points_app.app.run(host='127.0.0.1', port={port}, debug=False)
+else: points_app.serve_production('127.0.0.1', {port}, {threads}, {workers})
+'''
+
+def percentile(sorted_vals, p):
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * p / 100))] if sorted_vals else 0
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1): return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('服务器未能启动')
+
+def client_loop(port, ids, seed, deadline, out):
+    rnd = random.Random(seed)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    etag = None
+    latencies, statuses, errors = [], {}, 0
+    while time.time() < deadline:
+        r = rnd.random()
+        headers = {'Accept-Encoding': 'gzip'}
+        method, body = 'GET', None
+        if r < 0.3: path = '/api/ranking'
+        elif r < 0.5:
+            path = '/api/students'
+            if etag: headers['If-None-Match'] = etag
+        elif r < 0.65: path = f'/api/students/{rnd.choice(ids)}/rank'
+        elif r < 0.8: path = '/api/events/recent'
+        elif r < 0.9: path = '/api/bounties/progress'
+        else:
+            method, path = 'POST', f'/api/students/{rnd.choice(ids)}/quick_points'
+            body = json.dumps({'change_amount': 1})
+            headers['Content-Type'] = 'application/json'
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            res = conn.getresponse()
+            res.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            continue
+        latencies.append((time.perf_counter() - t0) * 1000)
+        statuses[res.status] = statuses.get(res.status, 0) + 1
+        if path == '/api/students' and res.getheader('ETag'): etag = res.getheader('ETag')
+    conn.close()
+    out.append((latencies, statuses, errors))
+
+def run_server(name, db, clients, seconds, threads, seed):
+    workers = 0 if name == 'dev' else int(name.partition(':')[2] or 1)
+    work_dir = tempfile.mkdtemp()
+    work = os.path.join(work_dir, 'bench.db')
+    shutil.copy(db, work)
+    port = free_port()
+    code = SERVER.format(root=ROOT, db=work, backups=os.path.join(work_dir, 'backups'), port=port, threads=threads, workers=workers)
+    proc = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        conn.request('GET', '/api/students')
+        ids = [s['id'] for s in json.loads(conn.getresponse().read())]
+        conn.close()
+        out = []
+        deadline = time.time() + seconds
+        pool = [threading.Thread(target=client_loop, args=(port, ids, seed * 1000 + n, deadline, out)) for n in range(clients)]
+        t0 = time.perf_counter()
+        for t in pool: t.start()
+        for t in pool: t.join()
+        wall = time.perf_counter() - t0
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    latencies = sorted(l for ls, _, _ in out for l in ls)
+    statuses = {}
+    for _, st, _ in out:
+        for k, v in st.items(): statuses[k] = statuses.get(k, 0) + v
+    return {
+        'server': name, 'requests': len(latencies), 'req_per_s': len(latencies) / wall,
+        'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95), 'p99': percentile(latencies, 99),
+        'errors': sum(e for _, _, e in out), 'status': dict(sorted(statuses.items())),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--db', required=True, help='generate.py 生成的数据库')
+    ap.add_argument('--clients', type=int, default=50, help='并发长连接数')
+    ap.add_argument('--seconds', type=float, default=15)
+    ap.add_argument('--threads', type=int, default=64, help='生产模式每个进程的线程数 (与 Config.SERVE_THREADS 默认值一致)')
+    ap.add_argument('--servers', default='dev,serve', help='逗号分隔：dev / serve / serve:N')
+    ap.add_argument('--seed', type=int, default=5)
+    args = ap.parse_args()
+
+    for name in args.servers.split(','):
+        r = run_server(name, args.db, args.clients, args.seconds, args.threads, args.seed)
+        print(f"{r['server']:<8} {r['requests']} 次请求 ({r['req_per_s']:.0f} 次/秒), "
+              f"p50 {r['p50']:.1f}ms p95 {r['p95']:.1f}ms p99 {r['p99']:.1f}ms, 连接错误 {r['errors']}, 状态 {r['status']}")
+
+if __name__ == '__main__':
+    main()
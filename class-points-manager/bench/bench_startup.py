@@ -0,0 +1,102 @@
+"""
+冷启动压测：导入耗时分解 (python -X importtime) 与从拉起进程到第一个请求返回的时间
+
+用法: python bench/bench_startup.py [--db data/class_points.db] [--runs 5] [--out results/startup-<版本>.json]
+
+每项取多次运行的中位数；数据库先复制到临时目录。结果可跨版本对比冷启动变化。
+"""
+import argparse, http.client, json, os, platform, re, shutil, socket, statistics, subprocess, sys, tempfile, time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER = '''
+import sys
+sys.path.insert(0, {root!r})
+import app as points_app
+C = points_app.Config
+C.DATABASE_PATH = points_app.db_pool.path = {db!r}
+C.BACKUP_DIR, C.BACKUP_INTERVAL_HOURS = {backups!r}, 0
+points_app.init_db()
+points_app.app.run(host='127.0.0.1', port={port}, debug=False)
+'''
+
+IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def import_breakdown():
+    """app.py 直接导入的各模块累计耗时 (微秒)，以及 import app 的总耗时"""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT,
+                         capture_output=True, text=True, check=True).stderr
+    rows = [(int(cum), len(indent), name) for _, cum, indent, name in IMPORTTIME.findall(out)]
+    app_row = next(r for r in reversed(rows) if r[2] == 'app')
+    # importtime 按导入完成顺序输出，app 的直接子模块紧挨在它前面、缩进多一级
+    direct, total = {}, app_row[0]
+    for cum, depth, name in rows[:rows.index(app_row)]:
+        if depth == app_row[1] + 2: direct[name] = direct.get(name, 0) + cum
+    return total, direct
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def first_request(db):
+    work_dir = tempfile.mkdtemp()
+    work = os.path.join(work_dir, 'bench.db')
+    shutil.copy(db, work)
+    port = free_port()
+    code = SERVER.format(root=ROOT, db=work, backups=os.path.join(work_dir, 'backups'), port=port)
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                conn.request('GET', '/api/system/info')
+                if conn.getresponse().status == 200: return (time.perf_counter() - t0) * 1000
+            except OSError:
+                if proc.poll() is not None: raise RuntimeError('服务器启动失败')
+                time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--db', default=os.path.join(ROOT, 'data', 'class_points.db'))
+    ap.add_argument('--runs', type=int, default=5)
+    ap.add_argument('--top', type=int, default=10, help='列出耗时最多的前 N 个导入')
+    ap.add_argument('--out', help='结果 JSON 输出路径')
+    args = ap.parse_args()
+
+    import_breakdown()  # 先跑一次生成 __pycache__，之后各次都是热缓存下的冷启动
+    runs = [import_breakdown() for _ in range(args.runs)]
+    totals = [t for t, _ in runs]
+    modules = {name: statistics.median(d.get(name, 0) for _, d in runs) for name in set().union(*(d for _, d in runs))}
+    first = [first_request(args.db) for _ in range(args.runs)]
+
+    report = {
+        'schema': 1,
+        'meta': {'revision': git_revision(), 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                 'python': platform.python_version(), 'platform': platform.platform(), 'runs': args.runs},
+        'import_app_ms': round(statistics.median(totals) / 1000, 1),
+        'first_request_ms': round(statistics.median(first), 1),
+        'imports_ms': {k: round(v / 1000, 1) for k, v in sorted(modules.items(), key=lambda kv: -kv[1])},
+    }
+    print(f"import app: {report['import_app_ms']} ms, 拉起进程到首个请求返回: {report['first_request_ms']} ms")
+    for name, ms in list(report['imports_ms'].items())[:args.top]:
+        print(f'    {name:<28}{ms:>8.1f} ms')
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f: json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'结果已写入 {args.out}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+写入争用压测：多线程同时加分、小组加分、提交申报、基本准则扣分、出价，对比单写线程 (group commit) 与每请求各自开事务
+
+用法: python bench/bench_writes.py [--clients 50] [--ops 40] [--mode both|queue|direct]
+"""
+import argparse, os, random, sqlite3, sys, tempfile, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as points_app
+from generate import generate
+
+def percentile(sorted_vals, p):
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * p / 100))] if sorted_vals else 0
+
+def run_mode(queue_mode, clients, ops, seed):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    generate(path, students=200, history=20000, groups=10, seed=seed)
+    points_app.writer.stop()
+    points_app.db_pool.close_all()
+    points_app.Config.DATABASE_PATH = path
+    points_app.db_pool.path = path
+    points_app.Config.WRITE_QUEUE = queue_mode
+    conn = sqlite3.connect(path)
+    ids = [r[0] for r in conn.execute('SELECT id FROM students')]
+    group_ids = [r[0] for r in conn.execute('SELECT id FROM groups')]
+    auction_id = conn.execute("SELECT id FROM auctions WHERE status = 'active'").fetchone()[0]
+    before_sum = conn.execute('SELECT SUM(points) FROM students').fetchone()[0]
+    before_max = conn.execute('SELECT MAX(id) FROM points_history').fetchone()[0]
+    conn.close()
+    batches0, jobs0 = points_app.writer.batches, points_app.writer.jobs
+
+    latencies, failures = [], {}
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients)
+
+    def client_loop(n):
+        client = points_app.app.test_client()
+        with client.session_transaction() as sess: sess['logged_in'] = True
+        rnd = random.Random(seed * 1000 + n)
+        barrier.wait()
+        for i in range(ops):
+            sid = rnd.choice(ids)
+            r = rnd.random()
+            t0 = time.perf_counter()
+            if r < 0.35:
+                res = client.post(f'/api/students/{sid}/quick_points', json={'change_amount': 1})
+            elif r < 0.65:
+                res = client.post('/api/audit/submit', json={'student_ids': [sid], 'change_amount': 2, 'reason': '[自定义/品德楷模] 压测申报'})
+            elif r < 0.8:
+                res = client.post('/api/auction/bid', json={'auction_id': auction_id, 'student_id': sid, 'amount': 10 + n * ops + i})
+            elif r < 0.97:
+                # 先读组员再写：旧做法里读事务升级为写事务，最容易撞上 database is locked
+                res = client.post(f'/api/groups/{rnd.choice(group_ids)}/quick_points', json={'change_amount': 1})
+            else:
+                res = client.post('/api/audit/submit', json={'student_ids': [sid], 'change_amount': -1, 'reason': '[班级管理/早自习] 压测扣分'})
+            elapsed = (time.perf_counter() - t0) * 1000
+            with lock:
+                latencies.append(elapsed)
+                # 出价被拒 (400) 是正常业务结果，只统计 5xx
+                if res.status_code >= 500:
+                    msg = (res.get_json() or {}).get('error', str(res.status_code))
+                    failures[msg] = failures.get(msg, 0) + 1
+
+    threads = [threading.Thread(target=client_loop, args=(n,)) for n in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    wall = time.perf_counter() - t0
+
+    # 校验：余额增量等于新写入的已生效流水合计
+    conn = sqlite3.connect(path)
+    after_sum = conn.execute('SELECT SUM(points) FROM students').fetchone()[0]
+    applied = conn.execute("SELECT COALESCE(SUM(change_amount), 0) FROM points_history WHERE id > ? AND status = 'approved'", (before_max,)).fetchone()[0]
+    conn.close()
+    assert after_sum - before_sum == applied, ('余额与流水不一致', after_sum - before_sum, applied)
+
+    latencies.sort()
+    total = clients * ops
+    batches, jobs = points_app.writer.batches - batches0, points_app.writer.jobs - jobs0
+    return {
+        'mode': '单写线程' if queue_mode else '各自开事务',
+        'ops': total, 'wall_s': wall, 'ops_per_s': total / wall,
+        'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95), 'p99': percentile(latencies, 99),
+        'errors': sum(failures.values()), 'failures': failures,
+        'avg_batch': jobs / batches if batches else None,
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--clients', type=int, default=50)
+    ap.add_argument('--ops', type=int, default=40, help='每个客户端的写请求数')
+    ap.add_argument('--mode', choices=['both', 'queue', 'direct'], default='both')
+    ap.add_argument('--seed', type=int, default=3)
+    args = ap.parse_args()
+    points_app.app.config['TESTING'] = True
+
+    modes = {'both': [False, True], 'queue': [True], 'direct': [False]}[args.mode]
+    for queue_mode in modes:
+        r = run_mode(queue_mode, args.clients, args.ops, args.seed)
+        batch = f", 平均每批 {r['avg_batch']:.1f} 个任务" if r['avg_batch'] else ''
+        print(f"{r['mode']}: {r['ops']} 次写请求 {r['wall_s']:.2f}s ({r['ops_per_s']:.0f} 次/秒), "
+              f"p50 {r['p50']:.1f}ms p95 {r['p95']:.1f}ms p99 {r['p99']:.1f}ms, 5xx {r['errors']}{batch}")
+        for msg, n in r['failures'].items(): print(f'    {n} x {msg}')
+
+if __name__ == '__main__':
+    main()
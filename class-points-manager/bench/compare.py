@@ -0,0 +1,35 @@
+"""
+对比两次 run.py 的结果: python bench/compare.py old.json new.json
+"""
+import json, sys
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request', 'bytes')
+
+def load(path):
+    with open(path, encoding='utf-8') as f: return json.load(f)
+
+def main():
+    if len(sys.argv) != 3:
+        print(__doc__.strip())
+        sys.exit(2)
+    old, new = load(sys.argv[1]), load(sys.argv[2])
+    if old.get('schema') != new.get('schema'):
+        print(f"警告: 结果格式版本不同 ({old.get('schema')} vs {new.get('schema')})")
+    if old['meta'].get('dataset') != new['meta'].get('dataset'):
+        print(f"警告: 数据集规模不同 {old['meta'].get('dataset')} vs {new['meta'].get('dataset')}")
+    print(f"{old['meta'].get('revision')} -> {new['meta'].get('revision')}")
+    for name in sorted(set(old['endpoints']) | set(new['endpoints'])):
+        a, b = old['endpoints'].get(name), new['endpoints'].get(name)
+        if not a or not b:
+            print(f"{name}: {'新增' if b else '移除'}")
+            continue
+        parts = []
+        for m in METRICS:
+            x, y = a.get(m), b.get(m)
+            if x is None or y is None: continue
+            delta = f'{(y - x) / x * 100:+.0f}%' if x else 'n/a'
+            parts.append(f'{m} {x} -> {y} ({delta})')
+        print(f'{name}\n    ' + '\n    '.join(parts))
+
+if __name__ == '__main__':
+    main()
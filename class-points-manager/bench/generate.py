@@ -0,0 +1,114 @@
+"""
+合成数据生成器：按给定规模生成一所学校/班级的数据库 (固定随机种子，可复现)
+
+用法:
+    python bench/generate.py --preset school --out /tmp/school.db
+    python bench/generate.py --students 2000 --history 1000000 --seed 1 --out /tmp/custom.db
+
+预设规模: class (50 人 / 1 万条), school (2000 人 / 50 万条), district (2 万人 / 500 万条)
+"""
+import argparse, os, random, sqlite3, sys, time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as points_app
+
+PRESETS = {
+    'class': {'students': 50, 'history': 10000, 'groups': 6},
+    'school': {'students': 2000, 'history': 500000, 'groups': 40},
+    'district': {'students': 20000, 'history': 5000000, 'groups': 400},
+}
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢姜崔钟谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武戴莫孔向汤'
+GIVEN = '子涵浩宇欣怡梓轩一诺雨泽思远佳琪俊杰晨曦紫萱博文诗雨天佑明轩若曦嘉怡宇航梦琪皓然雅静志强晓东'
+GROUP_WORDS = ['飞龙', '破晓', '星火', '凌云', '逐梦', '启航', '先锋', '雄鹰', '朝阳', '闪电']
+COLORS = ['#4f46e5', '#ef4444', '#10b981', '#f59e0b', '#8b5cf6', '#06b6d4', '#ec4899', '#84cc16']
+
+def reason_pool():
+    """理由分布与真实课堂接近：常规扣分/加分为主，夹杂基本准则奖励、随机点名、兑换与拍卖"""
+    pool = [(f'[{a}/{c}] {n}', p, 'benchmark_penalty' if p < 0 and a in ('学业管理', '班级管理') else 'manual', 10)
+            for a, c, n, p in points_app.default_point_standards()]
+    pool += [('[基本准则] 作业缺交/抄袭/敷衍 - 达标奖励', 2, 'benchmark_bonus', 200),
+             ('[互动管理/随机点名] 幸运抽中加分', 1, 'quick', 30),
+             ('兑换: 免作业券', -30, 'redemption', 5),
+             ('拍卖得标: 小熊玩偶', -40, 'auction', 2),
+             ('达成悬赏: 赛季冠军奖杯', -50, 'bounty', 1)]
+    return pool
+
+def generate(out, students, history, groups, seed=42, days=150, pending_ratio=0.03):
+    if os.path.exists(out): os.remove(out)
+    points_app.Config.DATABASE_PATH = out
+    points_app.init_db()
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(out)
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('INSERT OR REPLACE INTO system_config (id, class_name, teacher_name) VALUES (1, ?, ?)', ('压测学校', '测试老师'))
+    conn.execute('INSERT OR REPLACE INTO classes (id, name, teacher) VALUES (1, ?, ?)', ('压测学校', '测试老师'))
+    conn.executemany('INSERT INTO groups (id, class_id, name, color) VALUES (?, 1, ?, ?)',
+                     [(i, f'{GROUP_WORDS[i % len(GROUP_WORDS)]}{i}组', COLORS[i % len(COLORS)]) for i in range(1, groups + 1)])
+    conn.executemany('INSERT INTO point_standards (area, category, name, default_points) VALUES (?, ?, ?, ?)',
+                     points_app.default_point_standards())
+
+    balances = [0] * (students + 1)
+    roster = []
+    for i in range(1, students + 1):
+        name = rnd.choice(SURNAMES) + ''.join(rnd.sample(GIVEN, rnd.choice([1, 2])))
+        roster.append((i, rnd.randint(1, groups), name, f'{2025000000 + i}'))
+    conn.executemany('INSERT INTO students (id, class_id, group_id, name, student_id, points) VALUES (?, 1, ?, ?, ?, 0)', roster)
+
+    pool = reason_pool()
+    weights = [w for *_, w in pool]
+    start = datetime.now() - timedelta(days=days)
+    teachers = ['课代表', '学习委员', '班长', '测试老师']
+    sql = 'INSERT INTO points_history (student_id, change_amount, reason, teacher, status, created_at, created_date, kind) VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+    batch = []
+    for n in range(history):
+        sid = rnd.randint(1, students)
+        reason, pts, kind, _ = rnd.choices(pool, weights)[0]
+        status = 'approved'
+        r = rnd.random()
+        # 拍卖、悬赏结项当场扣分，没有审核环节
+        if kind in ('auction', 'bounty'): pass
+        elif r < pending_ratio: status = 'pending'
+        elif r < pending_ratio + 0.01: status = 'rejected'
+        # 历史记录按时间大致递增，与真实写入顺序一致
+        ts = start + timedelta(seconds=int(days * 86400 * n / max(history, 1)) + rnd.randint(0, 600))
+        if status == 'approved': balances[sid] += pts
+        batch.append((sid, pts, reason, rnd.choice(teachers), status, ts.strftime('%Y-%m-%d %H:%M:%S'), ts.strftime('%Y-%m-%d'), kind))
+        if len(batch) >= 50000:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch: conn.executemany(sql, batch)
+    conn.executemany('UPDATE students SET points = ? WHERE id = ?', [(balances[i], i) for i in range(1, students + 1)])
+
+    # 奖品、悬赏与进行中的拍卖 (悬赏在历史写入后再建，进度一次性回填)
+    conn.executemany('INSERT INTO rewards (id, name, points_cost, stock, is_special, is_grocery) VALUES (?, ?, ?, ?, ?, ?)',
+                     [(1, '赛季冠军奖杯', 500, 1, 1, 0), (2, '免作业券', 30, 100, 0, 1), (3, '小熊玩偶', 40, 5, 1, 0)])
+    allowed = ','.join(f'[活动管理/{c}] 代表班级参赛(基础奖)' for c in ['校级竞赛', '体育运动'])
+    conn.execute('INSERT INTO bounties (id, reward_id, target_points, allowed_reasons, start_date, type, status) VALUES (1, 1, 500, ?, ?, "individual", "active")',
+                 (allowed, (start + timedelta(days=days // 2)).strftime('%Y-%m-%d')))
+    conn.execute('INSERT INTO bounties (id, reward_id, target_points, allowed_reasons, type, status) VALUES (2, 2, 2000, "", "group", "active")')
+    for bid in (1, 2): points_app.backfill_bounty_progress(conn, bid)
+    conn.execute('INSERT INTO auctions (reward_id, class_id, current_price, status) VALUES (3, 1, 10, "active")')
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--preset', choices=PRESETS, default='class')
+    ap.add_argument('--students', type=int)
+    ap.add_argument('--history', type=int)
+    ap.add_argument('--groups', type=int)
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--out', required=True)
+    args = ap.parse_args()
+
+    size = dict(PRESETS[args.preset])
+    for k in ('students', 'history', 'groups'):
+        if getattr(args, k): size[k] = getattr(args, k)
+    t0 = time.perf_counter()
+    generate(args.out, seed=args.seed, **size)
+    print(f"生成完成: {size['students']} 名学生, {size['history']} 条历史, {size['groups']} 个小组 -> {args.out} ({time.perf_counter() - t0:.1f}s)")
+
+if __name__ == '__main__':
+    main()
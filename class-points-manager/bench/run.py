@@ -0,0 +1,158 @@
+"""
+接口基准运行器：用 Flask test client 逐个压测热点接口，输出 p50/p95/p99 与每请求 SQL 条数
+
+用法:
+    python bench/run.py --db /tmp/school.db --requests 200 --out results/v3.json
+    python bench/compare.py results/old.json results/new.json
+
+数据库会先复制到临时目录再压测 (审核接口会修改数据)，原文件保持不变。
+"""
+import argparse, json, os, platform, random, shutil, sqlite3, subprocess, sys, tempfile, time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as points_app
+
+RESULTS_SCHEMA = 1
+
+class QueryCounter:
+    """挂在连接池上的 SQL 计数器。
+    Python 的 trace 回调对触发器内部语句回报的是外层语句文本，
+    因此连续重复的同一文本只计一次，触发器开销不计入 SQL 条数。"""
+    def __init__(self):
+        self.count = 0
+        self._last = None
+
+    def reset(self):
+        self.count = 0
+        self._last = None
+
+    def __call__(self, stmt):
+        if stmt != self._last and not stmt.lstrip().startswith('--'): self.count += 1
+        self._last = stmt
+
+def install_counter(counter):
+    connect = points_app.db_pool._connect
+    def traced():
+        conn = connect()
+        conn.set_trace_callback(counter)
+        return conn
+    points_app.db_pool._connect = traced
+
+def percentile(sorted_vals, p):
+    if not sorted_vals: return None
+    k = (len(sorted_vals) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+def build_cases(db, rnd):
+    """返回 [(名称, 方法, 生成 (url, json) 的函数)]"""
+    conn = sqlite3.connect(db)
+    ids = [r[0] for r in conn.execute('SELECT id FROM students').fetchall()]
+    last_day = conn.execute('SELECT MAX(created_date) FROM points_history').fetchone()[0] or datetime.now().strftime('%Y-%m-%d')
+    pending = [r[0] for r in conn.execute("SELECT id FROM points_history WHERE status = 'pending' ORDER BY id").fetchall()]
+    conn.close()
+    week_ago = (datetime.strptime(last_day, '%Y-%m-%d') - timedelta(days=6)).strftime('%Y-%m-%d')
+    pending_iter = iter([pending[i:i + 20] for i in range(0, len(pending), 20)])
+
+    return [
+        ('GET /api/classes/1/stats', 'GET', lambda: (f'/api/classes/1/stats?date={last_day}', None)),
+        ('GET /api/ranking', 'GET', lambda: ('/api/ranking', None)),
+        ('GET /api/ranking?type=group', 'GET', lambda: ('/api/ranking?type=group', None)),
+        ('GET /api/ranking (7 days)', 'GET', lambda: (f'/api/ranking?start_date={week_ago}&end_date={last_day}', None)),
+        ('GET /api/bounties/progress', 'GET', lambda: ('/api/bounties/progress', None)),
+        ('GET /api/events/recent', 'GET', lambda: ('/api/events/recent', None)),
+        ('GET /api/students', 'GET', lambda: ('/api/students', None)),
+        ('GET /api/students/<id>/history', 'GET', lambda: (f'/api/students/{rnd.choice(ids)}/history', None)),
+        ('POST /api/audit/process', 'POST', lambda: ('/api/audit/process', {'audit_ids': next(pending_iter, []), 'action': 'approve'})),
+    ]
+
+def run(db, n, warmup, seed, only=None):
+    work = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    shutil.copy(db, work)
+    points_app.Config.DATABASE_PATH = work
+    points_app.db_pool.path = work
+    counter = QueryCounter()
+    install_counter(counter)
+
+    client = points_app.app.test_client()
+    with client.session_transaction() as sess: sess['logged_in'] = True
+    rnd = random.Random(seed)
+    results = {}
+    for name, method, make in build_cases(work, rnd):
+        if only and only not in name: continue
+        for _ in range(warmup):
+            url, body = make()
+            client.open(url, method=method, json=body)
+        samples, queries, sizes, statuses = [], [], [], {}
+        for _ in range(n):
+            url, body = make()
+            counter.reset()
+            t0 = time.perf_counter()
+            res = client.open(url, method=method, json=body)
+            samples.append((time.perf_counter() - t0) * 1000)
+            queries.append(counter.count)
+            sizes.append(len(res.get_data()))
+            statuses[str(res.status_code)] = statuses.get(str(res.status_code), 0) + 1
+        samples.sort()
+        results[name] = {
+            'n': n,
+            'p50_ms': round(percentile(samples, 50), 3),
+            'p95_ms': round(percentile(samples, 95), 3),
+            'p99_ms': round(percentile(samples, 99), 3),
+            'mean_ms': round(sum(samples) / n, 3),
+            'queries_per_request': round(sum(queries) / n, 2),
+            'bytes': round(sum(sizes) / n),
+            'status': statuses,
+        }
+    return results
+
+def dataset_info(db):
+    conn = sqlite3.connect(db)
+    info = {'students': conn.execute('SELECT COUNT(*) FROM students').fetchone()[0],
+            'points_history': conn.execute('SELECT COUNT(*) FROM points_history').fetchone()[0],
+            'groups': conn.execute('SELECT COUNT(*) FROM groups').fetchone()[0]}
+    conn.close()
+    return info
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--db', required=True, help='generate.py 生成的数据库')
+    ap.add_argument('--requests', type=int, default=100, help='每个接口的采样次数')
+    ap.add_argument('--warmup', type=int, default=5)
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--only', help='只跑名称包含该字符串的接口')
+    ap.add_argument('--out', help='结果 JSON 输出路径')
+    args = ap.parse_args()
+
+    endpoints = run(args.db, args.requests, args.warmup, args.seed, args.only)
+    report = {
+        'schema': RESULTS_SCHEMA,
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'dataset': dataset_info(args.db),
+            'requests': args.requests,
+        },
+        'endpoints': endpoints,
+    }
+    print(f"{'接口':<34}{'p50':>9}{'p95':>9}{'p99':>9}{'SQL/次':>8}{'字节':>10}")
+    for name, r in endpoints.items():
+        print(f"{name:<36}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['queries_per_request']:>8}{r['bytes']:>10}")
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f: json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f'结果已写入 {args.out}')
+
+if __name__ == '__main__':
+    main()